@@ -0,0 +1,72 @@
+import math
+
+from flask import Blueprint, Response, abort, jsonify, request
+
+from . import config
+from .profiling import clear_slow_requests, sampler, slow_requests
+
+admin = Blueprint("admin", __name__, url_prefix="/admin")
+
+
+@admin.before_request
+def require_token():
+    # Open like /ingest unless ADMIN_TOKEN is configured
+    if config.ADMIN_TOKEN and request.headers.get("X-Admin-Token") != config.ADMIN_TOKEN:
+        abort(403)
+
+
+def _profiler_disabled():
+    # The sampler reads every sampled thread's stack, so it is never open to anonymous callers
+    if not config.ADMIN_TOKEN:
+        return jsonify({"error": "profiler disabled; set ADMIN_TOKEN to enable it"}), 403
+    return None
+
+
+@admin.post("/profile")
+def start_profile():
+    disabled = _profiler_disabled()
+    if disabled:
+        return disabled
+    body = request.get_json(silent=True) or {}
+    try:
+        sample_rate = float(body.get("sample_rate", 0.1))
+        duration_s = float(body.get("duration_s", 60))
+        interval_ms = float(body.get("interval_ms", 5))
+    except (TypeError, ValueError):
+        return jsonify({"error": "sample_rate, duration_s and interval_ms must be numbers"}), 400
+    if not all(math.isfinite(v) for v in (sample_rate, duration_s, interval_ms)):
+        return jsonify({"error": "sample_rate, duration_s and interval_ms must be finite"}), 400
+    # duration_s and interval_ms are clamped to MAX_PROFILE_DURATION_S / MIN_SAMPLE_INTERVAL_MS
+    return jsonify(sampler.start(sample_rate, duration_s, interval_ms))
+
+
+@admin.delete("/profile")
+def stop_profile():
+    return _profiler_disabled() or jsonify(sampler.stop())
+
+
+@admin.get("/profile")
+def get_profile():
+    disabled = _profiler_disabled()
+    if disabled:
+        return disabled
+    # Folded stacks (flamegraph.pl / speedscope input) by default; ?format=json for status + stacks
+    limit = request.args.get("limit", type=int)
+    stacks = sampler.folded(limit)
+    if request.args.get("format") == "json":
+        return jsonify({**sampler.status(), "stacks": stacks})
+    return Response("\n".join(stacks) + ("\n" if stacks else ""), mimetype="text/plain")
+
+
+@admin.get("/slow-requests")
+def get_slow_requests():
+    return jsonify({
+        "threshold_ms": config.SLOW_REQUEST_MS,
+        "requests": slow_requests(request.args.get("limit", type=int)),
+    })
+
+
+@admin.delete("/slow-requests")
+def delete_slow_requests():
+    clear_slow_requests()
+    return jsonify({"status": "ok"})
@@ -5,6 +5,8 @@ from dotenv import load_dotenv
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or os.getenv("OPEN_AI_API_KEY")
+# Point at an OpenAI-compatible server (e.g. app.fake_openai for load tests); empty uses api.openai.com
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
 CHROMA_DIR = os.getenv("CHROMA_DIR", "data/chroma")
 COLLECTION_NAME = os.getenv("CHROMA_COLLECTION", "knowledge_base")
 KNOWLEDGE_JSON_PATH = os.getenv("KNOWLEDGE_JSON_PATH", "knowledge_base/knowledge_base.json")
@@ -14,11 +16,27 @@ VECTOR_TOP_K = int(os.getenv("VECTOR_TOP_K", "10"))
 FUSION_K = int(os.getenv("FUSION_K", "8"))
 RRF_K = int(os.getenv("RRF_K", "60"))
 MAX_GRAPH_ITERS = int(os.getenv("MAX_GRAPH_ITERS", "2"))
+REQUEST_DEADLINE_MS = int(os.getenv("REQUEST_DEADLINE_MS", "0"))  # default /ask budget; 0 = none
 PORT = int(os.getenv("PORT", "8080"))
 HOST = os.getenv("HOST", "0.0.0.0")
 
 # Optional enhancements
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "0"))  # 0 disables chunking
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "0"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))  # docs per Chroma/corpus write
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# RAGAS scoring on /qa; when off, ragas/datasets/pandas are never imported
+RAGAS_ENABLED = os.getenv("RAGAS_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+# Requests slower than this keep their span tree for GET /admin/slow-requests; 0 disables
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", "5000"))
+SLOW_REQUEST_BUFFER = int(os.getenv("SLOW_REQUEST_BUFFER", "50"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # when set, /admin/* requires X-Admin-Token
+
+# Upstream LLM admission control (see app/scheduler.py); 0 disables a limit
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "0"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "0"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+LLM_QUEUE_TIMEOUT_S = float(os.getenv("LLM_QUEUE_TIMEOUT_S", "30"))
+LLM_EST_COMPLETION_TOKENS = int(os.getenv("LLM_EST_COMPLETION_TOKENS", "300"))
+LLM_SCHEDULER_STATE = os.getenv("LLM_SCHEDULER_STATE", "")  # file path shares buckets across workers
 
@@ -0,0 +1,281 @@
+"""Local stand-in for the OpenAI chat completions and embeddings endpoints.
+
+Used for load testing and offline tests: outputs are deterministic for a given
+input, and latency / error rate can be shaped to mimic the real upstream.
+
+Run standalone:
+    python -m app.fake_openai --port 8199 --latency-ms 300 --latency-dist lognormal --error-rate 0.01
+then point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8199/v1.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from flask import Flask, Response, jsonify, request
+
+EMBED_DIM = 1536
+LATENCY_DISTS = ("fixed", "uniform", "normal", "lognormal")
+
+_word_re = re.compile(r"[A-Za-z0-9']+")
+_cite_re = re.compile(r"\[([A-Z]+_\d+)\]")
+_rec_re = re.compile(r"^Recommendation:\s*(.+)$", re.MULTILINE)
+
+
+class LatencyModel:
+    """Samples per-request latency (seconds) from a simple distribution.
+
+    mean_ms/jitter_ms are interpreted per distribution: uniform draws from
+    [mean - jitter, mean + jitter], normal uses jitter as the standard deviation,
+    lognormal uses mean as the median and jitter/mean as sigma (heavy right tail).
+    """
+
+    def __init__(self, mean_ms: float = 0.0, jitter_ms: float = 0.0, dist: str = "fixed", seed: Optional[int] = None):
+        if dist not in LATENCY_DISTS:
+            raise ValueError(f"Unknown latency distribution: {dist}")
+        self.mean_ms = float(mean_ms)
+        self.jitter_ms = float(jitter_ms)
+        self.dist = dist
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        if self.mean_ms <= 0:
+            return 0.0
+        with self._lock:
+            if self.dist == "uniform":
+                ms = self._rng.uniform(self.mean_ms - self.jitter_ms, self.mean_ms + self.jitter_ms)
+            elif self.dist == "normal":
+                ms = self._rng.gauss(self.mean_ms, self.jitter_ms)
+            elif self.dist == "lognormal":
+                sigma = self.jitter_ms / self.mean_ms if self.jitter_ms else 0.5
+                ms = self._rng.lognormvariate(math.log(self.mean_ms), sigma)
+            else:
+                ms = self.mean_ms
+        return max(ms, 0.0) / 1000.0
+
+
+def _tokens(text: str) -> List[str]:
+    return [m.group(0).lower() for m in _word_re.finditer(text)]
+
+
+def _bucket(token: str) -> Tuple[int, float]:
+    h = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+    idx = int.from_bytes(h[:4], "little") % EMBED_DIM
+    sign = 1.0 if h[4] & 1 else -1.0
+    return idx, sign
+
+
+def fake_embedding(value) -> List[float]:
+    """Deterministic hashed bag-of-words vector (unit length).
+
+    Texts sharing words land close together, so vector search over the fake
+    embeddings still returns sensible neighbours. Token-id inputs (as sent by
+    tiktoken-aware clients) are hashed the same way, id by id.
+    """
+    if isinstance(value, str):
+        feats = _tokens(value)
+    else:
+        feats = [str(t) for t in value]
+    vec = [0.0] * EMBED_DIM
+    for tok in feats:
+        idx, sign = _bucket(tok)
+        vec[idx] += sign
+    norm = math.sqrt(sum(v * v for v in vec))
+    if not norm:
+        vec[0] = 1.0
+        return vec
+    return [v / norm for v in vec]
+
+
+def _encode_base64(vec: List[float]) -> str:
+    return base64.b64encode(struct.pack(f"<{len(vec)}f", *vec)).decode("ascii")
+
+
+def _message_text(messages: List[Dict]) -> str:
+    parts = []
+    for m in messages:
+        content = m.get("content")
+        if isinstance(content, list):
+            content = " ".join(c.get("text", "") for c in content if isinstance(c, dict))
+        parts.append(content or "")
+    return "\n".join(parts)
+
+
+def fake_completion(messages: List[Dict]) -> str:
+    """Pick a canned but input-dependent reply based on which prompt this looks like."""
+    last = _message_text(messages[-1:]) if messages else ""
+    if "needs_revision" in last:
+        return json.dumps({"needs_revision": False, "reasons": "fake critic: answer accepted"})
+    if last.startswith("Rewrite the user's question"):
+        question = last.split("Question:", 1)[-1].strip()
+        return question or "question"
+    recs = _rec_re.findall(last)
+    cites = list(dict.fromkeys(_cite_re.findall(last)))
+    if not recs and not cites:
+        return "I could not find relevant recommendations in the provided context."
+    lines = []
+    for i, rec in enumerate(recs[:3]):
+        cite = f" [{cites[i]}]" if i < len(cites) else ""
+        lines.append(f"- {rec.strip()}{cite}")
+    if not lines:
+        lines = [f"- See [{c}]" for c in cites[:3]]
+    return "Based on the provided context:\n" + "\n".join(lines)
+
+
+def _usage(prompt_text: str, completion_text: str = "") -> Dict[str, int]:
+    p = max(1, len(prompt_text) // 4)
+    c = len(completion_text) // 4
+    return {"prompt_tokens": p, "completion_tokens": c, "total_tokens": p + c}
+
+
+def _error(status: int, message: str, err_type: str):
+    return jsonify({"error": {"message": message, "type": err_type, "param": None, "code": None}}), status
+
+
+def create_app(latency: Optional[LatencyModel] = None, error_rate: float = 0.0, seed: Optional[int] = None) -> Flask:
+    latency = latency or LatencyModel()
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    stats = {"chat": 0, "embeddings": 0, "errors": 0}
+    app = Flask(__name__)
+    app.config["FAKE_STATS"] = stats
+
+    def bump(key: str):
+        with rng_lock:
+            stats[key] += 1
+
+    def maybe_fail():
+        if error_rate <= 0:
+            return None
+        with rng_lock:
+            roll = rng.random()
+        if roll >= error_rate:
+            return None
+        bump("errors")
+        # Split failures between the two kinds clients most need to handle
+        if roll < error_rate / 2:
+            return _error(429, "Rate limit reached (fake)", "rate_limit_error")
+        return _error(500, "Upstream error (fake)", "server_error")
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok", "stats": stats}
+
+    @app.post("/v1/chat/completions")
+    def chat_completions():
+        body = request.get_json(force=True)
+        bump("chat")
+        time.sleep(latency.sample())
+        failed = maybe_fail()
+        if failed is not None:
+            return failed
+        messages = body.get("messages") or []
+        model = body.get("model", "fake-chat")
+        text = fake_completion(messages)
+        prompt_text = _message_text(messages)
+        cid = "chatcmpl-" + uuid.uuid4().hex[:24]
+        created = int(time.time())
+
+        if body.get("stream"):
+            def events():
+                base = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model}
+                first = dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+                yield f"data: {json.dumps(first)}\n\n"
+                for piece in re.findall(r"\S+\s*", text):
+                    chunk = dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                last = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    last["usage"] = _usage(prompt_text, text)
+                yield f"data: {json.dumps(last)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return Response(events(), mimetype="text/event-stream")
+
+        return jsonify({
+            "id": cid,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": _usage(prompt_text, text),
+        })
+
+    @app.post("/v1/embeddings")
+    def embeddings():
+        body = request.get_json(force=True)
+        bump("embeddings")
+        time.sleep(latency.sample())
+        failed = maybe_fail()
+        if failed is not None:
+            return failed
+        inputs = body.get("input")
+        # A single string or a single token array is one input
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        b64 = body.get("encoding_format") == "base64"
+        data = []
+        n_tokens = 0
+        for i, item in enumerate(inputs or []):
+            vec = fake_embedding(item)
+            n_tokens += len(item) if not isinstance(item, str) else max(1, len(item) // 4)
+            data.append({"object": "embedding", "index": i, "embedding": _encode_base64(vec) if b64 else vec})
+        return jsonify({
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake-embedding"),
+            "usage": {"prompt_tokens": n_tokens, "total_tokens": n_tokens},
+        })
+
+    return app
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, **kwargs):
+    """Serve a fake app on a background thread; returns (server, base_url).
+
+    port=0 picks a free port. Call server.shutdown() to stop it.
+    """
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class _QuietHandler(WSGIRequestHandler):
+        # Per-request access logs drown out load test output
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server(host, port, create_app(**kwargs), threaded=True, request_handler=_QuietHandler)
+    t = threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True)
+    t.start()
+    return server, f"http://{host}:{server.server_port}/v1"
+
+
+def main():
+    p = argparse.ArgumentParser(description="Fake OpenAI chat/embeddings server for load testing")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8199)
+    p.add_argument("--latency-ms", type=float, default=0.0, help="mean (or median for lognormal) latency")
+    p.add_argument("--jitter-ms", type=float, default=0.0)
+    p.add_argument("--latency-dist", choices=LATENCY_DISTS, default="fixed")
+    p.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429/500")
+    p.add_argument("--seed", type=int, default=None)
+    args = p.parse_args()
+    latency = LatencyModel(args.latency_ms, args.jitter_ms, args.latency_dist, seed=args.seed)
+    app = create_app(latency=latency, error_rate=args.error_rate, seed=args.seed)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
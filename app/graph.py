@@ -1,13 +1,22 @@
-from typing import TypedDict, List, Dict, Any
+import logging
+import re
+import threading
+import time
+from typing import TypedDict, List, Dict, Any, Callable, Optional
 
+import openai
 from langgraph.graph import StateGraph, END
 from langchain.schema import HumanMessage, SystemMessage
 
 from .llm import get_chat
+from .profiling import attach_thread, span
 from .retrieval import HybridRetriever
+from .scheduler import QueueFullError
 from .prompts import SYSTEM_PROMPT, CRITIC_PROMPT
 from . import config
 
+logger = logging.getLogger(__name__)
+
 
 class QAState(TypedDict, total=False):
     question: str
@@ -17,17 +26,92 @@ class QAState(TypedDict, total=False):
     answer: str
     critique: Dict[str, Any]
     iteration: int
+    timings: Dict[str, float]
+    deadline: float  # time.monotonic() value the answer is due by
+    skipped: List[str]
+
+
+# Starting guesses (ms) for what each node costs; blended with observed timings as requests run
+_DEFAULT_STAGE_COST_MS = {"rewrite_query": 600.0, "retrieve": 250.0, "generate": 1500.0, "critic": 900.0, "revise": 1500.0}
+# Per-skip shrink of a stage's estimate, so a stage skipped on a stale estimate gets retried
+_SKIP_DECAY = 0.9
+_rec_line_re = re.compile(r"^Recommendation:\s*(.+)$", re.MULTILINE)
 
 
 class QAGraph:
     def __init__(self):
         self.chat = get_chat()
         self.retriever = HybridRetriever()
+        self.stage_cost_ms = dict(_DEFAULT_STAGE_COST_MS)
+        self._cost_observed: set = set()
+        self._cost_lock = threading.Lock()
         self.graph = self._build()
 
+    # Deadline helpers
+    @staticmethod
+    def _remaining_ms(state: QAState) -> Optional[float]:
+        deadline = state.get("deadline")
+        if deadline is None:
+            return None
+        return (deadline - time.monotonic()) * 1000.0
+
+    def _cost(self, *stages: str) -> float:
+        with self._cost_lock:
+            return sum(self.stage_cost_ms[s] for s in stages)
+
+    def _affordable(self, state: QAState, *stages: str, fraction: float = 1.0, decay: bool = False) -> bool:
+        remaining = self._remaining_ms(state)
+        if remaining is None or remaining >= fraction * self._cost(*stages):
+            return True
+        if decay:
+            # A skipped stage yields no new timing, so one slow run would keep it skipped for good.
+            # Shrink its estimate instead; once it runs again, the real timing corrects it.
+            with self._cost_lock:
+                self.stage_cost_ms[stages[0]] *= _SKIP_DECAY
+        return False
+
+    def _observe(self, stage: str, elapsed_ms: float) -> None:
+        # EWMA of real runs; the first sample is only averaged with the default guess,
+        # so a single cold call can't set the estimate on its own
+        with self._cost_lock:
+            weight = 0.2 if stage in self._cost_observed else 0.5
+            self.stage_cost_ms[stage] = (1 - weight) * self.stage_cost_ms[stage] + weight * elapsed_ms
+            self._cost_observed.add(stage)
+
+    def _llm_timeout(self, state: QAState, *reserve: str) -> Dict[str, float]:
+        # Budget left for this call, minus what the `reserve` stages after it are expected to need
+        remaining = self._remaining_ms(state)
+        if remaining is None:
+            return {}
+        remaining -= self._cost(*reserve)
+        return {"timeout": max(remaining, 1.0) / 1000.0}
+
+    @staticmethod
+    def _skip(state: QAState, stage: str) -> List[str]:
+        return list(state.get("skipped") or []) + [stage]
+
+    @staticmethod
+    def _extractive_answer(contexts: List[Dict[str, Any]], n: int = 3) -> str:
+        # No-LLM fallback: quote the top recommendations directly, with their citations
+        lines = []
+        for r in contexts[:n]:
+            meta = r.get("metadata", {})
+            rid = meta.get("recommendation_id") or meta.get("id") or r.get("id")
+            text = r.get("text", "")
+            m = _rec_line_re.search(text)
+            rec = m.group(1).strip() if m else text.strip().split("\n", 1)[0]
+            if rec:
+                lines.append(f"- {rec} [{rid}]")
+        if not lines:
+            return "I couldn't find relevant recommendations in the knowledge base for this question in time."
+        return "Top recommendations from the knowledge base:\n" + "\n".join(lines)
+
     # Nodes
     def rewrite_query(self, state: QAState) -> QAState:
         q = state["question"].strip()
+        # Keep enough budget for retrieval and the answer itself
+        if not self._affordable(state, "rewrite_query", "retrieve", "generate", decay=True):
+            return {"query": q, "skipped": self._skip(state, "rewrite_query")}
         prompt = (
             "Rewrite the user's question to be standalone and explicit for retrieval. "
             "Preserve meaning; add relevant synonyms and terms from health/wellness domain. "
@@ -35,18 +119,42 @@ class QAGraph:
             + q
         )
         try:
-            out = self.chat.invoke([HumanMessage(content=prompt)])
+            out = self.chat.invoke([HumanMessage(content=prompt)], priority="interactive",
+                                   **self._llm_timeout(state, "retrieve", "generate"))
             rewritten = out.content.strip()
             return {"query": rewritten}
+        except QueueFullError:
+            if state.get("deadline") is None:
+                raise
+            # Under a deadline the raw question is good enough; don't turn congestion into a 429
+            return {"query": q, "skipped": self._skip(state, "rewrite_query")}
         except Exception:
+            if state.get("deadline") is not None:
+                return {"query": q, "skipped": self._skip(state, "rewrite_query")}
             return {"query": q}
 
     def retrieve(self, state: QAState) -> QAState:
         query = state.get("query") or state["question"]
+        update: QAState = {}
         # optional filters: not used by BM25 currently; could filter posthoc by metadata
-        results = self.retriever.search(query)
-        # keep top MAX_CONTEXT_CHUNKS
-        ctx = results[: config.MAX_CONTEXT_CHUNKS]
+        use_vector = self._affordable(state, "retrieve", decay=True)
+        if not use_vector:
+            update["skipped"] = self._skip(state, "vector_search")
+        try:
+            results = self.retriever.search(query, use_vector=use_vector, **self._llm_timeout(state))
+        except (QueueFullError, TimeoutError, openai.APIError) as e:
+            if state.get("deadline") is None:
+                raise
+            # No capacity or time for the query embedding: BM25 alone still answers
+            logger.warning("vector search skipped: %s: %s", type(e).__name__, e)
+            update["skipped"] = self._skip(state, "vector_search")
+            results = self.retriever.search(query, use_vector=False)
+        # keep top MAX_CONTEXT_CHUNKS (half when the budget is tight, to keep the prompt short)
+        n_chunks = config.MAX_CONTEXT_CHUNKS
+        if not self._affordable(state, "retrieve", "generate", "critic"):
+            n_chunks = max(1, n_chunks // 2)
+            update["skipped"] = self._skip({**state, **update}, "full_context")
+        ctx = results[:n_chunks]
         # apply simple metadata filters if provided
         filters = state.get("filters") or {}
         if filters:
@@ -56,11 +164,16 @@ class QAGraph:
             filtered = list(filter(keep, ctx))
             if filtered:
                 ctx = filtered
-        return {"contexts": ctx}
+        update["contexts"] = ctx
+        return update
 
     def generate(self, state: QAState) -> QAState:
+        contexts = state.get("contexts", [])
+        # The LLM call is bounded by the deadline anyway, so give it a chance on a tighter budget
+        if not self._affordable(state, "generate", fraction=0.5, decay=True):
+            return {"answer": self._extractive_answer(contexts), "skipped": self._skip(state, "generate")}
         context_blocks = []
-        for r in state.get("contexts", []):
+        for r in contexts:
             meta = r.get("metadata", {})
             rid = meta.get("recommendation_id") or meta.get("id") or r.get("id")
             context_blocks.append(f"[{rid}]\n" + r["text"]) 
@@ -75,10 +188,21 @@ class QAGraph:
                 + "\n\nInstructions: Provide a concise, actionable answer. Cite each recommendation you use like [RECOMMENDATION_ID]."
             )
         )
-        out = self.chat.invoke([system, user])
+        try:
+            out = self.chat.invoke([system, user], priority="interactive", **self._llm_timeout(state))
+        except (QueueFullError, TimeoutError, openai.APIError) as e:
+            if state.get("deadline") is None:
+                raise
+            # Out of time (or capacity): a bounded-latency answer beats a timeout
+            logger.warning("generate fell back to the extractive answer: %s: %s", type(e).__name__, e)
+            return {"answer": self._extractive_answer(contexts), "skipped": self._skip(state, "generate")}
         return {"answer": out.content}
 
     def critic(self, state: QAState) -> QAState:
+        if "generate" in (state.get("skipped") or []) or not self._affordable(state, "critic", decay=True):
+            # Nothing to check (extractive answer) or no time to check it
+            return {"critique": {"needs_revision": False, "reasons": "skipped: deadline"},
+                    "skipped": self._skip(state, "critic")}
         system = SystemMessage(content=CRITIC_PROMPT)
         user = HumanMessage(
             content=(
@@ -91,7 +215,19 @@ class QAGraph:
                 + "\n\nOutput a strict JSON object with keys: needs_revision (true/false), reasons (string)."
             )
         )
-        out = self.chat.invoke([system, user])
+        try:
+            out = self.chat.invoke([system, user], priority="refine", **self._llm_timeout(state))
+        except QueueFullError:
+            # Shed the critic under load; the drafted answer stands, unchecked
+            return {"critique": {"needs_revision": False, "reasons": "skipped: LLM queue full"},
+                    "skipped": self._skip(state, "critic")}
+        except (TimeoutError, openai.APIError) as e:
+            if state.get("deadline") is None:
+                raise
+            # Out of time: keep the drafted answer rather than failing the request
+            logger.warning("critic skipped at the deadline: %s: %s", type(e).__name__, e)
+            return {"critique": {"needs_revision": False, "reasons": "skipped: deadline"},
+                    "skipped": self._skip(state, "critic")}
         text = out.content.strip()
         needs = False
         reasons = ""
@@ -105,16 +241,25 @@ class QAGraph:
             # If parsing failed, be conservative and accept the answer
             needs = False
             reasons = "parse_error"
-        return {"critique": {"needs_revision": needs, "reasons": reasons}}
+        update: QAState = {"critique": {"needs_revision": needs, "reasons": reasons}}
+        if needs and not self._affordable(state, "revise", decay=True):
+            update["skipped"] = self._skip(state, "revise")
+        return update
 
     # Edges
     def should_revise(self, state: QAState) -> str:
         it = int(state.get("iteration", 0))
         crit = state.get("critique", {})
+        if "revise" in (state.get("skipped") or []):
+            return "final"
         if crit.get("needs_revision") and it + 1 < config.MAX_GRAPH_ITERS:
             return "revise"
         return "final"
 
+    def after_revise(self, state: QAState) -> str:
+        # An unrevised draft was already checked; don't send it to the critic again
+        return "final" if "revise" in (state.get("skipped") or []) else "critic"
+
     def revise(self, state: QAState) -> QAState:
         # Use critique to regenerate
         system = SystemMessage(content=SYSTEM_PROMPT)
@@ -128,29 +273,52 @@ class QAGraph:
                 + "\n\n".join([c.get("text", "") for c in state.get("contexts", [])])
             )
         )
-        out = self.chat.invoke([system, user])
+        try:
+            out = self.chat.invoke([system, user], priority="refine", **self._llm_timeout(state))
+        except (QueueFullError, TimeoutError, openai.APIError) as e:
+            if state.get("deadline") is None and not isinstance(e, QueueFullError):
+                raise
+            # Keep the draft as is
+            logger.warning("revise skipped: %s: %s", type(e).__name__, e)
+            return {"iteration": int(state.get("iteration", 0)) + 1, "skipped": self._skip(state, "revise")}
         return {"answer": out.content, "iteration": int(state.get("iteration", 0)) + 1}
 
+    def _timed(self, name: str, fn: Callable[[QAState], QAState]) -> Callable[[QAState], QAState]:
+        # Accumulate wall time per node (ms); critic/revise may run more than once
+        def node(state: QAState) -> QAState:
+            start = time.perf_counter()
+            with span(name):
+                attach_thread()
+                out = fn(state)
+            elapsed = (time.perf_counter() - start) * 1000.0
+            if len(out.get("skipped", ())) <= len(state.get("skipped") or ()):
+                # Feed the deadline planner real runs only; skips are near-instant
+                self._observe(name, elapsed)
+            timings = dict(state.get("timings") or {})
+            timings[name] = round(timings.get(name, 0.0) + elapsed, 3)
+            return {**out, "timings": timings}
+        return node
+
     def _build(self):
         g = StateGraph(QAState)
-        g.add_node("rewrite_query", self.rewrite_query)
-        g.add_node("retrieve", self.retrieve)
-        g.add_node("generate", self.generate)
-        g.add_node("critic", self.critic)
-        g.add_node("revise", self.revise)
+        for name in ("rewrite_query", "retrieve", "generate", "critic", "revise"):
+            g.add_node(name, self._timed(name, getattr(self, name)))
 
         g.set_entry_point("rewrite_query")
         g.add_edge("rewrite_query", "retrieve")
         g.add_edge("retrieve", "generate")
         g.add_edge("generate", "critic")
         g.add_conditional_edges("critic", self.should_revise, {"revise": "revise", "final": END})
-        g.add_edge("revise", "critic")
+        g.add_conditional_edges("revise", self.after_revise, {"critic": "critic", "final": END})
         return g.compile()
 
-    def run(self, question: str, filters: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    def run(self, question: str, filters: Dict[str, Any] | None = None,
+            deadline_ms: float | None = None) -> Dict[str, Any]:
         initial: QAState = {"question": question, "iteration": 0}
         if filters:
             initial["filters"] = filters
+        if deadline_ms:
+            initial["deadline"] = time.monotonic() + deadline_ms / 1000.0
         final = self.graph.invoke(initial)
         return {
             "question": question,
@@ -158,5 +326,7 @@ class QAGraph:
             "contexts": final.get("contexts", []),
             "critique": final.get("critique", {}),
             "iterations": final.get("iteration", 0),
+            "timings": final.get("timings", {}),
+            "skipped": final.get("skipped", []),
         }
 
@@ -1,7 +1,11 @@
 import json
+import logging
 import os
+import resource
 import shutil
-from typing import List, Dict
+import sys
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, TextIO
 
 from langchain_core.documents import Document
 from langchain_community.vectorstores import Chroma
@@ -9,14 +13,102 @@ from langchain_community.vectorstores import Chroma
 from .llm import get_embeddings
 from . import config
 
+logger = logging.getLogger(__name__)
+
+
+# Decode errors this close to the end of the buffer may just be a token cut in half ("fal", "\\u00")
+_TRUNCATION_SLACK = 8
+
+
+def _iter_json_array(f: TextIO, chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    # Decode one top-level array element at a time; memory is bounded by the largest element
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+    read_size = chunk_size
+
+    def fill() -> bool:
+        nonlocal buf, pos, eof
+        chunk = f.read(read_size)
+        if not chunk:
+            eof = True
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    while True:
+        while pos < len(buf) and buf[pos].isspace():
+            pos += 1
+        if pos >= len(buf):
+            if not fill():
+                raise ValueError("Unexpected end of JSON input")
+            continue
+        ch = buf[pos]
+        if not started:
+            if ch != "[":
+                raise ValueError("Expected a JSON array of knowledge base entries")
+            started = True
+            pos += 1
+            continue
+        if ch == "]":
+            return
+        if ch == ",":
+            pos += 1
+            continue
+        if ch != "{":
+            # Only objects are valid entries. A bare number cut at a chunk boundary would also
+            # decode "successfully" as its prefix, so reject those before decoding.
+            raise ValueError(f"Expected knowledge base entries to be JSON objects, got {buf[pos:pos + 20]!r}")
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            # Only input cut off by the buffer edge (an error right at its end, or a string still open)
+            # is worth reading more for; any other syntax error is raised before reading the rest
+            truncated = e.pos >= len(buf) - _TRUNCATION_SLACK or e.msg.startswith("Unterminated string")
+            if not truncated or eof or not fill():
+                raise
+            # Element spans beyond the buffer; grow reads so huge entries are not re-parsed per chunk
+            read_size *= 2
+            continue
+        if end == len(buf) and not eof and fill():
+            # A scalar cut at the buffer edge would decode short; retry with more input
+            continue
+        read_size = chunk_size
+        pos = end
+        yield obj
+
+
+def iter_knowledge_base(path: str) -> Iterator[Dict]:
+    """Stream KB entries from a JSON array or a JSONL file (one entry per line)."""
+    with open(path, "r", encoding="utf-8") as f:
+        jsonl = path.endswith((".jsonl", ".ndjson"))
+        if not jsonl:
+            head = f.read(1)
+            while head and head.isspace():
+                head = f.read(1)
+            jsonl = head == "{"
+            f.seek(0)
+        if jsonl:
+            for lineno, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if not isinstance(entry, dict):
+                    raise ValueError(f"Expected knowledge base entries to be JSON objects, got {line[:20]!r} on line {lineno}")
+                yield entry
+        else:
+            yield from _iter_json_array(f)
+
 
 def load_knowledge_base(path: str) -> List[Dict]:
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return list(iter_knowledge_base(path))
 
 
-def build_documents(kb: List[Dict]) -> List[Document]:
-    docs: List[Document] = []
+def build_documents(kb: Iterable[Dict]) -> Iterator[Document]:
     for entry in kb:
         symptom = entry.get("symptom")
         category = entry.get("category")
@@ -38,7 +130,7 @@ def build_documents(kb: List[Dict]) -> List[Document]:
                 while start < len(base_text):
                     end = start + config.CHUNK_SIZE
                     chunk = base_text[start:end]
-                    docs.append(Document(page_content=chunk, metadata=metadata))
+                    yield Document(page_content=chunk, metadata=metadata)
                     if not config.CHUNK_OVERLAP:
                         start = end
                     else:
@@ -46,47 +138,102 @@ def build_documents(kb: List[Dict]) -> List[Document]:
                         if start <= 0:
                             start = end
             else:
-                docs.append(Document(page_content=base_text, metadata=metadata))
-    return docs
+                yield Document(page_content=base_text, metadata=metadata)
+
+
+def _doc_id(d: Document) -> str:
+    return getattr(d, "id", None) or d.metadata.get("recommendation_id")
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, max(1, size)))
+        if not batch:
+            return
+        yield batch
+
+
+class CorpusWriter:
+    """Writes the BM25 corpus snapshot incrementally as a JSON array.
+
+    Goes to a temp file that replaces out_path on close, so readers never see a
+    half-written snapshot.
+    """
+
+    def __init__(self, out_path: str):
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        self.out_path = out_path
+        self.tmp_path = out_path + ".tmp"
+        self._f = open(self.tmp_path, "w", encoding="utf-8")
+        self._f.write("[")
+        self.count = 0
 
+    def write(self, docs: Iterable[Document]) -> None:
+        for d in docs:
+            item = {"id": _doc_id(d), "text": d.page_content, "metadata": d.metadata}
+            self._f.write(",\n" if self.count else "\n")
+            self._f.write(json.dumps(item, ensure_ascii=False))
+            self.count += 1
 
-def persist_corpus_json(docs: List[Document], out_path: str):
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    serializable = [
-        {
-            "id": getattr(d, "id", None) or d.metadata.get("recommendation_id"),
-            "text": d.page_content,
-            "metadata": d.metadata,
-        }
-        for d in docs
-    ]
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(serializable, f, ensure_ascii=False, indent=2)
+    def close(self) -> None:
+        self._f.write("\n]\n")
+        self._f.close()
+        os.replace(self.tmp_path, self.out_path)
 
+    def abort(self) -> None:
+        self._f.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
 
-def ingest(reset: bool = True) -> Dict[str, int]:
+
+def persist_corpus_json(docs: Iterable[Document], out_path: str):
+    writer = CorpusWriter(out_path)
+    try:
+        writer.write(docs)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0, 1)
+
+
+def ingest(reset: bool = True) -> Dict[str, float]:
     # Optionally reset persistent stores
     if reset and os.path.isdir(config.CHROMA_DIR):
         shutil.rmtree(config.CHROMA_DIR)
 
-    kb = load_knowledge_base(config.KNOWLEDGE_JSON_PATH)
-    docs = build_documents(kb)
-
     # Vector store (Chroma via LangChain)
-    embeddings = get_embeddings()
+    # Wait out a busy scheduler rather than abort with some batches already written
+    embeddings = get_embeddings(priority="background", wait_for_capacity=True)
     vectorstore = Chroma(
         collection_name=config.COLLECTION_NAME,
         embedding_function=embeddings,
         persist_directory=config.CHROMA_DIR,
     )
 
-    # Add with explicit ids for fusion
-    ids = [getattr(d, "id", None) or d.metadata.get("recommendation_id") for d in docs]
-    vectorstore.add_documents(docs, ids=ids)
-    vectorstore.persist()
-
+    # Stream KB -> documents -> bounded batches, so memory does not grow with the input
+    docs = build_documents(iter_knowledge_base(config.KNOWLEDGE_JSON_PATH))
     # Persist a BM25 corpus snapshot for runtime construction
-    persist_corpus_json(docs, os.path.join("data", "corpus.json"))
-
-    return {"documents": len(docs)}
+    writer = CorpusWriter(os.path.join("data", "corpus.json"))
+    n_batches = 0
+    try:
+        for batch in batched(docs, config.INGEST_BATCH_SIZE):
+            # Add with explicit ids for fusion
+            vectorstore.add_documents(batch, ids=[_doc_id(d) for d in batch])
+            writer.write(batch)
+            n_batches += 1
+    except BaseException:
+        writer.abort()
+        raise
+    vectorstore.persist()
+    writer.close()
 
+    stats = {"documents": writer.count, "batches": n_batches, "peak_rss_mb": peak_rss_mb()}
+    logger.info("ingest finished: %s", stats)
+    return stats
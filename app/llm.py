@@ -1,16 +1,141 @@
-from typing import Optional
+import asyncio
+import time
+from typing import Any, List, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_core.rate_limiters import BaseRateLimiter
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from . import config
+from .profiling import span
+from .scheduler import QueueFullError, estimate_tokens, get_scheduler
 
 
-def get_chat(model: str = "gpt-4o-mini", temperature: float = 0.2) -> ChatOpenAI:
+class ScheduledChat:
+    """ChatOpenAI front that takes a scheduler slot (at the given priority) per call.
+
+    Calls with a timeout go through `bounded` (a client without retries) when given,
+    since each retry would get the full timeout again and blow through the deadline.
+    """
+
+    def __init__(self, chat: ChatOpenAI, bounded: Optional[ChatOpenAI] = None):
+        self.inner = chat
+        self.bounded = bounded or chat
+
+    def invoke(self, messages: List[Any], priority: str = "interactive", timeout: Optional[float] = None, **kwargs: Any):
+        # timeout (seconds) bounds both the queue wait and the upstream request
+        prompt = "".join(str(getattr(m, "content", m)) for m in messages)
+        est = estimate_tokens(prompt) + config.LLM_EST_COMPLETION_TOKENS
+        scheduler = get_scheduler()
+        if timeout is None:
+            with span("llm.queue"):
+                scheduler.acquire(priority, est)
+            with span("llm.call"):
+                out = self.inner.invoke(messages, **kwargs)
+        else:
+            with span("llm.queue"):
+                waited = scheduler.acquire(priority, est, timeout=min(timeout, scheduler.queue_timeout))
+            with span("llm.call"):
+                out = self.bounded.invoke(messages, timeout=max(timeout - waited, 0.001), **kwargs)
+        usage = getattr(out, "usage_metadata", None) or {}
+        scheduler.settle(est, usage.get("total_tokens"))
+        return out
+
+
+class SchedulerRateLimiter(BaseRateLimiter):
+    """Adapts the scheduler to LangChain's rate_limiter hook, for chat models we don't call directly (RAGAS).
+
+    The hook carries no prompt, so each call is charged a fixed `tokens` estimate.
+    """
+
+    def __init__(self, priority: str = "background", tokens: int = 1, timeout: Optional[float] = None):
+        self.priority = priority
+        self.tokens = tokens
+        self.timeout = timeout
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        try:
+            get_scheduler().acquire(self.priority, self.tokens, timeout=self.timeout if blocking else 0.0)
+        except QueueFullError:
+            if blocking:
+                raise
+            return False
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        # The scheduler blocks on a threading.Condition; keep that off the event loop
+        return await asyncio.to_thread(self.acquire, blocking=blocking)
+
+
+class ScheduledEmbeddings(Embeddings):
+    """Embeddings wrapper that takes a scheduler slot per upstream call.
+
+    Like ScheduledChat, a query embedded with a timeout goes through `bounded` (no retries).
+    With wait_for_capacity, a call that can't get a slot sleeps for the scheduler's retry_after
+    and tries again instead of raising QueueFullError; batch jobs (ingestion) use this so a busy
+    scheduler slows them down rather than aborting them halfway.
+    """
+
+    def __init__(self, inner: Embeddings, priority: str = "interactive", timeout: Optional[float] = None,
+                 bounded: Optional[Embeddings] = None, wait_for_capacity: bool = False):
+        self.inner = inner
+        self.bounded = bounded or inner
+        self.priority = priority
+        self.timeout = timeout  # queue wait bound in seconds; None uses LLM_QUEUE_TIMEOUT_S
+        self.wait_for_capacity = wait_for_capacity
+
+    def _acquire(self, tokens: int) -> float:
+        while True:
+            try:
+                return get_scheduler().acquire(self.priority, tokens, timeout=self.timeout)
+            except QueueFullError as e:
+                if not self.wait_for_capacity:
+                    raise
+                time.sleep(e.retry_after)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # One slot per upstream batch, matching how the inner client splits requests
+        size = getattr(self.inner, "chunk_size", 1000) or 1000
+        out: List[List[float]] = []
+        for i in range(0, len(texts), size):
+            batch = texts[i : i + size]
+            with span("embed.queue"):
+                self._acquire(sum(estimate_tokens(t) for t in batch))
+            with span("embed.call"):
+                out.extend(self.inner.embed_documents(batch))
+        return out
+
+    def embed_query(self, text: str, timeout: Optional[float] = None) -> List[float]:
+        # timeout (seconds) bounds both the queue wait and the upstream request
+        scheduler = get_scheduler()
+        if timeout is None:
+            with span("embed.queue"):
+                self._acquire(estimate_tokens(text))
+            with span("embed.call"):
+                return self.inner.embed_query(text)
+        queue_timeout = scheduler.queue_timeout if self.timeout is None else self.timeout
+        with span("embed.queue"):
+            waited = scheduler.acquire(self.priority, estimate_tokens(text), timeout=min(timeout, queue_timeout))
+        with span("embed.call"):
+            return self.bounded.embed_query(text, timeout=max(timeout - waited, 0.001))
+
+
+def get_chat(model: str = "gpt-4o-mini", temperature: float = 0.2) -> ScheduledChat:
     if not config.OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY is not set. Please configure environment or .env file.")
-    return ChatOpenAI(model=model, temperature=temperature, api_key=config.OPENAI_API_KEY)
+    def make(**extra: Any) -> ChatOpenAI:
+        return ChatOpenAI(model=model, temperature=temperature, api_key=config.OPENAI_API_KEY,
+                          base_url=config.OPENAI_BASE_URL, **extra)
+
+    return ScheduledChat(make(), bounded=make(max_retries=0))
 
 
-def get_embeddings(model: str = "text-embedding-3-small") -> OpenAIEmbeddings:
+def get_embeddings(model: str = "text-embedding-3-small", priority: str = "interactive",
+                   wait_for_capacity: bool = False) -> ScheduledEmbeddings:
     if not config.OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY is not set. Please configure environment or .env file.")
-    return OpenAIEmbeddings(model=model, api_key=config.OPENAI_API_KEY)
+    # Custom endpoints get raw strings; tiktoken pre-splitting only matters for api.openai.com
+    def make(**extra: Any) -> OpenAIEmbeddings:
+        return OpenAIEmbeddings(model=model, api_key=config.OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL,
+                                check_embedding_ctx_length=config.OPENAI_BASE_URL is None, **extra)
 
+    return ScheduledEmbeddings(make(), priority=priority, bounded=make(max_retries=0),
+                               wait_for_capacity=wait_for_capacity)
@@ -0,0 +1,267 @@
+"""Closed-loop load generator for the Flask app.
+
+Drives /ask and/or /qa at a fixed concurrency and reports throughput, latency
+percentiles per endpoint and a per-graph-node breakdown (from the "timings"
+field QAGraph.run returns).
+
+Offline, against the bundled fake OpenAI server (no network, no API spend):
+    python -m app.loadtest --fake-llm --concurrency 8 --requests 200 --llm-latency-ms 150
+
+Against a running server:
+    python -m app.loadtest --url http://localhost:8080 --endpoint /ask --duration 60
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import config
+from .fake_openai import LATENCY_DISTS
+
+DEFAULT_QUESTIONS = [
+    "I have trouble sleeping; what should I try?",
+    "How can I reduce hot flashes at night?",
+    "What helps with mood swings and irritability?",
+    "Any tips for brain fog and poor concentration?",
+    "How do I manage joint pain and stiffness?",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    # Nearest-rank percentile; good enough for load test reporting
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(len(ordered), max(1, math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 2),
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "max_ms": round(max(values), 2),
+    }
+
+
+def _extract_timings(endpoint: str, body: Optional[Dict]) -> Dict[str, float]:
+    if not isinstance(body, dict):
+        return {}
+    result = body.get("result") if endpoint == "/qa" else body
+    if not isinstance(result, dict):
+        return {}
+    return result.get("timings") or {}
+
+
+def http_sender(base_url: str, timeout: float = 120.0) -> Callable[[str, Dict], Tuple[int, Optional[Dict]]]:
+    base_url = base_url.rstrip("/")
+
+    def send(endpoint: str, payload: Dict) -> Tuple[int, Optional[Dict]]:
+        req = urllib.request.Request(
+            base_url + endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                return resp.status, json.loads(resp.read() or b"null")
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+    return send
+
+
+def in_process_sender() -> Callable[[str, Dict], Tuple[int, Optional[Dict]]]:
+    from .server import app
+
+    local = threading.local()
+
+    def send(endpoint: str, payload: Dict) -> Tuple[int, Optional[Dict]]:
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        resp = client.post(endpoint, json=payload)
+        return resp.status_code, resp.get_json(silent=True)
+
+    return send
+
+
+def run_load(
+    send: Callable[[str, Dict], Tuple[int, Optional[Dict]]],
+    endpoints: List[str],
+    questions: List[str],
+    concurrency: int = 4,
+    requests: Optional[int] = 100,
+    duration: Optional[float] = None,
+    warmup: int = 1,
+    deadline_ms: Optional[float] = None,
+) -> Dict:
+    """Run `concurrency` workers back-to-back until `requests` are sent or `duration` elapses."""
+    jobs = itertools.cycle([(ep, q) for q in questions for ep in endpoints])
+    jobs_lock = threading.Lock()
+    results: List[Tuple[str, int, float, Dict[str, float]]] = []
+    results_lock = threading.Lock()
+    issued = [0]
+
+    def payload(q: str) -> Dict:
+        return {"question": q, "deadline_ms": deadline_ms} if deadline_ms else {"question": q}
+
+    # Warm up caches/indexes (first request may ingest) outside the measured window
+    for _ in range(warmup):
+        ep, q = next(jobs)
+        send(ep, payload(q))
+
+    def next_job():
+        with jobs_lock:
+            if requests is not None and issued[0] >= requests:
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            issued[0] += 1
+            return next(jobs)
+
+    def worker():
+        while True:
+            job = next_job()
+            if job is None:
+                return
+            ep, q = job
+            start = time.perf_counter()
+            try:
+                status, body = send(ep, payload(q))
+            except Exception:
+                status, body = 0, None
+            elapsed = (time.perf_counter() - start) * 1000.0
+            with results_lock:
+                results.append((ep, status, elapsed, _extract_timings(ep, body)))
+
+    if requests is None and duration is None:
+        raise ValueError("Either requests or duration must be set")
+    started = time.monotonic()
+    deadline = started + duration if duration else None
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, concurrency))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.monotonic() - started
+    return build_report(results, wall, concurrency)
+
+
+def build_report(results: List[Tuple[str, int, float, Dict[str, float]]], wall_s: float, concurrency: int) -> Dict:
+    per_endpoint: Dict[str, Dict] = {}
+    for ep in sorted({r[0] for r in results}):
+        rows = [r for r in results if r[0] == ep]
+        ok = [r for r in rows if 200 <= r[1] < 300]
+        nodes: Dict[str, List[float]] = {}
+        for r in ok:
+            for node, ms in r[3].items():
+                nodes.setdefault(node, []).append(float(ms))
+        statuses: Dict[str, int] = {}
+        for r in rows:
+            statuses[str(r[1])] = statuses.get(str(r[1]), 0) + 1
+        per_endpoint[ep] = {
+            "requests": len(rows),
+            "errors": len(rows) - len(ok),
+            "status_counts": statuses,
+            "throughput_rps": round(len(rows) / wall_s, 2) if wall_s else 0.0,
+            "latency": summarize([r[2] for r in ok]),
+            "nodes": {n: summarize(v) for n, v in sorted(nodes.items())},
+        }
+    total = len(results)
+    return {
+        "concurrency": concurrency,
+        "wall_s": round(wall_s, 3),
+        "requests": total,
+        "errors": sum(v["errors"] for v in per_endpoint.values()),
+        "throughput_rps": round(total / wall_s, 2) if wall_s else 0.0,
+        "endpoints": per_endpoint,
+    }
+
+
+def use_fake_llm(latency_ms: float = 0.0, jitter_ms: float = 0.0, dist: str = "fixed",
+                 error_rate: float = 0.0, seed: Optional[int] = 0, workdir: Optional[str] = None):
+    """Start the fake OpenAI server and point config (and a scratch data dir) at it.
+
+    The scratch working directory keeps fake embeddings out of the real data/chroma store,
+    and a fake key is used so a real one is never sent anywhere.
+    Returns the fake server; call .shutdown() when done.
+    """
+    from .fake_openai import LatencyModel, start_server
+
+    latency = LatencyModel(latency_ms, jitter_ms, dist, seed=seed)
+    server, base_url = start_server(latency=latency, error_rate=error_rate, seed=seed)
+    # Env vars too: RAGAS builds its own clients (and checks for a key) from the environment,
+    # so /qa is scored against the fake server and a real key in the environment is never sent
+    os.environ["OPENAI_BASE_URL"] = config.OPENAI_BASE_URL = base_url
+    os.environ["OPENAI_API_KEY"] = config.OPENAI_API_KEY = "sk-fake"
+    config.KNOWLEDGE_JSON_PATH = os.path.abspath(config.KNOWLEDGE_JSON_PATH)
+    os.chdir(workdir or tempfile.mkdtemp(prefix="mini-insight-load-"))
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Load test /ask and /qa")
+    p.add_argument("--url", help="base URL of a running server; omit to drive the app in-process")
+    p.add_argument("--endpoint", action="append", choices=["/ask", "/qa"], help="repeatable; default /ask")
+    p.add_argument("--concurrency", type=int, default=4)
+    p.add_argument("--requests", type=int, default=None, help="total requests (default 100 unless --duration)")
+    p.add_argument("--duration", type=float, default=None, help="seconds to run instead of a request count")
+    p.add_argument("--questions-file", help="file with one question per line")
+    p.add_argument("--deadline-ms", type=float, default=None, help="per-request latency budget sent to the app")
+    p.add_argument("--fake-llm", action="store_true", help="in-process only: use the bundled fake OpenAI server")
+    p.add_argument("--llm-latency-ms", type=float, default=0.0)
+    p.add_argument("--llm-jitter-ms", type=float, default=0.0)
+    p.add_argument("--llm-latency-dist", choices=LATENCY_DISTS, default="fixed")
+    p.add_argument("--llm-error-rate", type=float, default=0.0)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--fail-p95-ms", type=float, default=None, help="exit 1 if any endpoint p95 exceeds this")
+    p.add_argument("--fail-error-rate", type=float, default=None, help="exit 1 if error fraction exceeds this")
+    args = p.parse_args(argv)
+
+    if args.url and args.fake_llm:
+        p.error("--fake-llm applies to in-process runs; start app.fake_openai next to the server instead")
+    questions = DEFAULT_QUESTIONS
+    if args.questions_file:
+        with open(args.questions_file, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    fake = None
+    if args.fake_llm:
+        fake = use_fake_llm(args.llm_latency_ms, args.llm_jitter_ms, args.llm_latency_dist,
+                            args.llm_error_rate, args.seed)
+    try:
+        send = http_sender(args.url) if args.url else in_process_sender()
+        requests = args.requests if args.requests is not None or args.duration else 100
+        report = run_load(send, args.endpoint or ["/ask"], questions, args.concurrency, requests, args.duration,
+                          deadline_ms=args.deadline_ms)
+    finally:
+        if fake is not None:
+            fake.shutdown()
+
+    print(json.dumps(report, indent=2))
+    failed = False
+    if args.fail_p95_ms is not None:
+        failed |= any(e["latency"].get("p95_ms", 0) > args.fail_p95_ms for e in report["endpoints"].values())
+    if args.fail_error_rate is not None and report["requests"]:
+        failed |= report["errors"] / report["requests"] > args.fail_error_rate
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,119 +1,191 @@
 # RAGAS v0.3+ compatibility layer
-from typing import Dict, List, Optional, Tuple
+#
+# datasets/ragas/pandas are heavy to import, so nothing here is loaded until the first
+# evaluation (or availability check) asks for it, and never when RAGAS_ENABLED is off.
+from typing import Any, Dict, List, Optional, Tuple
 import os
+import threading
 
-from datasets import Dataset
+from . import config
+from .scheduler import estimate_tokens
 
-try:
-    from ragas import evaluate
-    # Metrics API differs across versions. Always try faithfulness; for relevance metric prefer
-    # ones that do not require a 'reference' column in the dataset.
-    from ragas.metrics import faithfulness as _faithfulness  # type: ignore
-    _context_metric = None
+_ragas: Optional[Dict[str, Any]] = None
+_ragas_lock = threading.Lock()
+
+
+def _import_ragas() -> Dict[str, Any]:
+    mods: Dict[str, Any] = {
+        "Dataset": None,
+        "evaluate": None,
+        "faithfulness": None,
+        "context_metric": None,
+        "LLMWrapperCls": None,
+        "EmbWrapperCls": None,
+        "ChatOpenAI": None,
+        "LCOpenAIEmbeddings": None,
+        "RunConfig": None,
+    }
     try:
-        from ragas.metrics import context_relevance as _ctx  # type: ignore
-        _context_metric = _ctx
-    except Exception:
-        # RAGAS >=0.3 may not expose context_relevance; prefer response_relevancy or context_utilization
+        from datasets import Dataset
+        from ragas import evaluate
+        # Metrics API differs across versions. Always try faithfulness; for relevance metric prefer
+        # ones that do not require a 'reference' column in the dataset.
+        from ragas.metrics import faithfulness as _faithfulness  # type: ignore
+        _context_metric = None
         try:
-            from ragas.metrics import response_relevancy as _ctx  # type: ignore
+            from ragas.metrics import context_relevance as _ctx  # type: ignore
             _context_metric = _ctx
         except Exception:
+            # RAGAS >=0.3 may not expose context_relevance; prefer response_relevancy or context_utilization
             try:
-                from ragas.metrics import context_utilization as _ctx  # type: ignore
+                from ragas.metrics import response_relevancy as _ctx  # type: ignore
                 _context_metric = _ctx
             except Exception:
-                # As a last resort, try context_precision/recall (may require 'reference')
                 try:
-                    from ragas.metrics import context_precision as _ctx  # type: ignore
+                    from ragas.metrics import context_utilization as _ctx  # type: ignore
                     _context_metric = _ctx
                 except Exception:
+                    # As a last resort, try context_precision/recall (may require 'reference')
                     try:
-                        from ragas.metrics import context_recall as _ctx  # type: ignore
+                        from ragas.metrics import context_precision as _ctx  # type: ignore
                         _context_metric = _ctx
                     except Exception:
-                        _context_metric = None
+                        try:
+                            from ragas.metrics import context_recall as _ctx  # type: ignore
+                            _context_metric = _ctx
+                        except Exception:
+                            _context_metric = None
 
-    # Prefer LangChain wrappers; names changed in ragas>=0.3 to *Wrapper
-    LLMWrapperCls = None
-    EmbWrapperCls = None
-    try:
-        from ragas.integrations.langchain import LangchainLLMWrapper as _LC_LLMW, LangchainEmbeddingsWrapper as _LC_EmW  # type: ignore
-        LLMWrapperCls = _LC_LLMW
-        EmbWrapperCls = _LC_EmW
-    except Exception:
+        # Prefer LangChain wrappers; names changed in ragas>=0.3 to *Wrapper
+        LLMWrapperCls = None
+        EmbWrapperCls = None
         try:
-            from ragas.llms import LangchainLLMWrapper as _Ragas_LLMW  # type: ignore
-            from ragas.embeddings import LangchainEmbeddingsWrapper as _Ragas_EmW  # type: ignore
-            LLMWrapperCls = _Ragas_LLMW
-            EmbWrapperCls = _Ragas_EmW
+            from ragas.integrations.langchain import LangchainLLMWrapper as _LC_LLMW, LangchainEmbeddingsWrapper as _LC_EmW  # type: ignore
+            LLMWrapperCls = _LC_LLMW
+            EmbWrapperCls = _LC_EmW
         except Exception:
-            # Older versions used LangchainLLM / LangchainEmbeddings
             try:
-                from ragas.integrations.langchain import LangchainLLM as _LC_LLM, LangchainEmbeddings as _LC_Emb  # type: ignore
-                LLMWrapperCls = _LC_LLM
-                EmbWrapperCls = _LC_Emb
+                from ragas.llms import LangchainLLMWrapper as _Ragas_LLMW  # type: ignore
+                from ragas.embeddings import LangchainEmbeddingsWrapper as _Ragas_EmW  # type: ignore
+                LLMWrapperCls = _Ragas_LLMW
+                EmbWrapperCls = _Ragas_EmW
             except Exception:
+                # Older versions used LangchainLLM / LangchainEmbeddings
                 try:
-                    from ragas.llms import LangchainLLM as _Ragas_LLM  # type: ignore
-                    from ragas.embeddings import LangchainEmbeddings as _Ragas_Emb  # type: ignore
-                    LLMWrapperCls = _Ragas_LLM
-                    EmbWrapperCls = _Ragas_Emb
+                    from ragas.integrations.langchain import LangchainLLM as _LC_LLM, LangchainEmbeddings as _LC_Emb  # type: ignore
+                    LLMWrapperCls = _LC_LLM
+                    EmbWrapperCls = _LC_Emb
                 except Exception:
-                    pass
+                    try:
+                        from ragas.llms import LangchainLLM as _Ragas_LLM  # type: ignore
+                        from ragas.embeddings import LangchainEmbeddings as _Ragas_Emb  # type: ignore
+                        LLMWrapperCls = _Ragas_LLM
+                        EmbWrapperCls = _Ragas_Emb
+                    except Exception:
+                        pass
+
+        try:
+            from ragas.run_config import RunConfig  # type: ignore
+        except Exception:
+            RunConfig = None
 
-    from langchain_openai import ChatOpenAI, OpenAIEmbeddings as LCOpenAIEmbeddings
+        from langchain_openai import ChatOpenAI, OpenAIEmbeddings as LCOpenAIEmbeddings
 
-    # Export common names for the rest of this module
-    faithfulness = _faithfulness
-    context_metric = _context_metric
-except Exception:  # pragma: no cover
-    evaluate = None
-    faithfulness = None
-    context_metric = None
-    LLMWrapperCls = None
-    EmbWrapperCls = None
-    ChatOpenAI = None
-    LCOpenAIEmbeddings = None
+        mods.update(
+            Dataset=Dataset,
+            evaluate=evaluate,
+            faithfulness=_faithfulness,
+            context_metric=_context_metric,
+            LLMWrapperCls=LLMWrapperCls,
+            EmbWrapperCls=EmbWrapperCls,
+            ChatOpenAI=ChatOpenAI,
+            LCOpenAIEmbeddings=LCOpenAIEmbeddings,
+            RunConfig=RunConfig,
+        )
+    except Exception:  # pragma: no cover
+        pass
+    return mods
+
+
+def get_ragas() -> Optional[Dict[str, Any]]:
+    """Import RAGAS and friends once, on first use; None when RAGAS_ENABLED is off."""
+    global _ragas
+    if not config.RAGAS_ENABLED:
+        return None
+    if _ragas is None:
+        with _ragas_lock:
+            if _ragas is None:
+                _ragas = _import_ragas()
+    return _ragas
 
 
 def ragas_available() -> Tuple[bool, str]:
-    if evaluate is None or faithfulness is None or context_metric is None:
-        return False, "ragas not importable"
-    if LLMWrapperCls is None or EmbWrapperCls is None or ChatOpenAI is None or LCOpenAIEmbeddings is None:
-        return False, "ragas adapters or langchain-openai unavailable"
     api_key = os.getenv("OPENAI_API_KEY") or os.getenv("OPEN_AI_API_KEY")
+    if not config.RAGAS_ENABLED:
+        return False, "ragas disabled"
+    # Check the key first so a keyless process never pays for the import
     if not api_key:
         return False, "OPENAI_API_KEY missing"
+    r = get_ragas()
+    if r["evaluate"] is None or r["faithfulness"] is None or r["context_metric"] is None:
+        return False, "ragas not importable"
+    if r["LLMWrapperCls"] is None or r["EmbWrapperCls"] is None or r["ChatOpenAI"] is None or r["LCOpenAIEmbeddings"] is None:
+        return False, "ragas adapters or langchain-openai unavailable"
     return True, "ok"
 
 
-def compute_ragas_metrics(question: str, answer: str, contexts: List[Dict]) -> Optional[Dict[str, float]]:
+def compute_ragas_metrics(question: str, answer: str, contexts: List[Dict],
+                          timeout: Optional[float] = None) -> Optional[Dict[str, float]]:
     """
+    timeout (seconds), when given, bounds every queue wait and upstream call RAGAS makes and
+    disables retries, so the evaluation fits in what is left of a request deadline.
+
     Environment overrides (optional):
+      - RAGAS_ENABLED: set to 0 to skip evaluation (and the RAGAS imports) entirely
       - RAGAS_LLM_MODEL: override default LLM model id (default: gpt-4o-mini)
       - RAGAS_EMBED_MODEL: override embedding model id (default: text-embedding-3-small)
+      - OPENAI_BASE_URL: OpenAI-compatible endpoint (e.g. app.fake_openai) instead of api.openai.com
     """
     # Compute RAGAS metrics for a single QA turn using LLM-based evaluation.
-    if evaluate is None or faithfulness is None or context_metric is None:
+    r = get_ragas()
+    if r is None or r["evaluate"] is None or r["faithfulness"] is None or r["context_metric"] is None:
         return None
     try:
         context_texts = [c.get("text", "") for c in contexts]
-        ds = Dataset.from_dict({
+        ds = r["Dataset"].from_dict({
             "question": [question],
             "answer": [answer],
             "contexts": [context_texts],
         })
 
         api_key = os.getenv("OPENAI_API_KEY") or os.getenv("OPEN_AI_API_KEY")
+        LLMWrapperCls, EmbWrapperCls = r["LLMWrapperCls"], r["EmbWrapperCls"]
+        ChatOpenAI, LCOpenAIEmbeddings = r["ChatOpenAI"], r["LCOpenAIEmbeddings"]
         if not api_key or LLMWrapperCls is None or EmbWrapperCls is None or ChatOpenAI is None or LCOpenAIEmbeddings is None:
             return None
         llm_model = os.getenv("RAGAS_LLM_MODEL", "gpt-4o-mini")
         emb_model = os.getenv("RAGAS_EMBED_MODEL", "text-embedding-3-small")
-        llm = LLMWrapperCls(ChatOpenAI(model=llm_model, temperature=0.0, api_key=api_key))
-        emb = EmbWrapperCls(LCOpenAIEmbeddings(model=emb_model, api_key=api_key))
+        base_url = os.getenv("OPENAI_BASE_URL") or None
+        from .llm import ScheduledEmbeddings, SchedulerRateLimiter
 
-        res = evaluate(ds, metrics=[faithfulness, context_metric], llm=llm, embeddings=emb)
+        # Every chat/embedding call RAGAS makes takes its own background scheduler slot.
+        # Each evaluation prompt carries roughly the question, answer and contexts.
+        per_call = estimate_tokens(question + answer + "".join(context_texts)) + config.LLM_EST_COMPLETION_TOKENS
+        limiter = SchedulerRateLimiter("background", per_call, timeout=timeout)
+        bounded = {} if timeout is None else {"timeout": timeout, "max_retries": 0}
+        llm = LLMWrapperCls(ChatOpenAI(model=llm_model, temperature=0.0, api_key=api_key, base_url=base_url,
+                                       rate_limiter=limiter, **bounded))
+        emb = EmbWrapperCls(ScheduledEmbeddings(
+            LCOpenAIEmbeddings(model=emb_model, api_key=api_key, base_url=base_url,
+                               check_embedding_ctx_length=base_url is None, **bounded),
+            priority="background",
+            timeout=timeout,
+        ))
+        kwargs: Dict[str, Any] = {}
+        if timeout is not None and r["RunConfig"] is not None:
+            # RAGAS runs its jobs concurrently, each bounded by the same timeout
+            kwargs["run_config"] = r["RunConfig"](timeout=timeout, max_retries=0)
+        res = r["evaluate"](ds, metrics=[r["faithfulness"], r["context_metric"]], llm=llm, embeddings=emb, **kwargs)
         row = res.to_pandas().iloc[0]  # type: ignore
         out: Dict[str, float] = {}
         for key in row.index:
@@ -124,4 +196,3 @@ def compute_ragas_metrics(question: str, answer: str, contexts: List[Dict]) -> O
         return out or None
     except Exception:
         return None
-
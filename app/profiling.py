@@ -0,0 +1,241 @@
+"""Request tracing, slow-request capture and an on-demand stack sampler.
+
+Every API request gets a lightweight span tree (graph nodes, retriever
+sub-stages, LLM queue/call, serialization). Requests slower than
+SLOW_REQUEST_MS keep their tree in a bounded ring buffer. An admin can also
+start a sampling session: for a time window, a fraction of requests have their
+thread's Python stack sampled every few ms, and the samples are aggregated into
+folded stacks ("a;b;c 42") that flamegraph.pl / speedscope read directly.
+"""
+
+import contextvars
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from . import config
+
+MAX_STACK_DEPTH = 128
+# Bounds on a sampling session, whatever the caller asks for
+MAX_PROFILE_DURATION_S = 300.0
+MIN_SAMPLE_INTERVAL_MS = 2.0
+
+
+class Trace:
+    """Span tree for one request. Spans nest by call order; times are ms from request start."""
+
+    def __init__(self, name: str, sampled: bool = False):
+        self.t0 = time.perf_counter()
+        self.started_at = time.time()
+        self.sampled = sampled
+        self.threads: set = set()  # threads the sampler follows for this request
+        self.root: Dict[str, Any] = {"name": name, "start_ms": 0.0, "duration_ms": None, "children": []}
+        self._stack: List[Dict[str, Any]] = [self.root]
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.t0) * 1000.0
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[Dict[str, Any]]:
+        node = {"name": name, "start_ms": round(self.elapsed_ms(), 3), "duration_ms": None, "children": []}
+        self._stack[-1]["children"].append(node)
+        self._stack.append(node)
+        start = time.perf_counter()
+        try:
+            yield node
+        finally:
+            node["duration_ms"] = round((time.perf_counter() - start) * 1000.0, 3)
+            if self._stack and self._stack[-1] is node:
+                self._stack.pop()
+
+    def finish(self) -> float:
+        self.root["duration_ms"] = round(self.elapsed_ms(), 3)
+        return self.root["duration_ms"]
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("mini_insight_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str) -> Iterator[Optional[Dict[str, Any]]]:
+    """Record a child span on the current request's trace; a no-op outside a request."""
+    trace = _current.get()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name) as node:
+        yield node
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples registered threads' stacks on a background thread for a fixed window."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._threads: Dict[int, int] = {}  # thread id -> number of sampled requests on it
+        self._stacks: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.sample_rate = 0.0
+        self.interval_s = 0.005
+        self.until = 0.0
+        self.started_at: Optional[float] = None
+        self.samples = 0
+        self.requests_sampled = 0
+
+    @property
+    def active(self) -> bool:
+        return time.monotonic() < self.until
+
+    def start(self, sample_rate: float, duration_s: float, interval_ms: float) -> Dict[str, Any]:
+        if self._thread is not None and self._stop.is_set():
+            # A stopped sampler may still be finishing its last pass
+            self._thread.join(1.0)
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+            self.requests_sampled = 0
+            self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+            self.interval_s = max(interval_ms, MIN_SAMPLE_INTERVAL_MS) / 1000.0
+            self.until = time.monotonic() + min(max(duration_s, 0.0), MAX_PROFILE_DURATION_S)
+            self.started_at = time.time()
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+        return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        self.until = 0.0
+        self._stop.set()
+        return self.status()
+
+    def should_sample(self) -> bool:
+        return self.active and random.random() < self.sample_rate
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests_sampled += 1
+
+    def register(self, tid: int) -> None:
+        with self._lock:
+            self._threads[tid] = self._threads.get(tid, 0) + 1
+
+    def unregister(self, tid: int) -> None:
+        with self._lock:
+            n = self._threads.get(tid, 0) - 1
+            if n > 0:
+                self._threads[tid] = n
+            else:
+                self._threads.pop(tid, None)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.is_set() and self.active:
+            with self._lock:
+                tids = [t for t in self._threads if t != own]
+            if tids:
+                frames = sys._current_frames()
+                folded = []
+                for tid in tids:
+                    frame = frames.get(tid)
+                    labels = []
+                    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                        labels.append(_frame_label(frame))
+                        frame = frame.f_back
+                    if labels:
+                        folded.append(";".join(reversed(labels)))
+                with self._lock:
+                    for stack in folded:
+                        self._stacks[stack] += 1
+                        self.samples += 1
+            self._stop.wait(self.interval_s)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "sample_rate": self.sample_rate,
+            "interval_ms": round(self.interval_s * 1000.0, 3),
+            "remaining_s": round(max(0.0, self.until - time.monotonic()), 3),
+            "started_at": self.started_at,
+            "samples": self.samples,
+            "requests_sampled": self.requests_sampled,
+        }
+
+    def folded(self, limit: Optional[int] = None) -> List[str]:
+        with self._lock:
+            items = self._stacks.most_common(limit)
+        return [f"{stack} {count}" for stack, count in items]
+
+
+sampler = StackSampler()
+_slow: Deque[Dict[str, Any]] = deque(maxlen=max(1, config.SLOW_REQUEST_BUFFER))
+_slow_lock = threading.Lock()
+
+
+def begin_request(name: str) -> None:
+    # Trace everything when slow capture is on; otherwise only requests picked for sampling
+    sampled = sampler.should_sample()
+    if not sampled and config.SLOW_REQUEST_MS <= 0:
+        return
+    trace = Trace(name, sampled=sampled)
+    _current.set(trace)
+    if sampled:
+        sampler.count_request()
+        attach_thread()
+
+
+def attach_thread() -> None:
+    """Let the sampler follow a sampled request onto the current thread (graph nodes may hop)."""
+    trace = _current.get()
+    if trace is not None and trace.sampled:
+        tid = threading.get_ident()
+        if tid not in trace.threads:
+            trace.threads.add(tid)
+            sampler.register(tid)
+
+
+def end_request(status: int) -> None:
+    trace = _current.get()
+    if trace is None:
+        return
+    _current.set(None)
+    duration = trace.finish()
+    for tid in trace.threads:
+        sampler.unregister(tid)
+    if config.SLOW_REQUEST_MS > 0 and duration >= config.SLOW_REQUEST_MS:
+        with _slow_lock:
+            _slow.append({
+                "name": trace.root["name"],
+                "status": status,
+                "duration_ms": duration,
+                "timestamp": trace.started_at,
+                "sampled": trace.sampled,
+                "spans": trace.root,
+            })
+
+
+def slow_requests(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    with _slow_lock:
+        items = list(_slow)
+    items.reverse()  # newest first
+    return items[:limit] if limit else items
+
+
+def clear_slow_requests() -> None:
+    with _slow_lock:
+        _slow.clear()
@@ -1,6 +1,6 @@
 import json
 import logging
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 
 from langchain_community.vectorstores import Chroma
 from rank_bm25 import BM25Okapi
@@ -8,6 +8,7 @@ from rank_bm25 import BM25Okapi
 from .llm import get_embeddings
 from . import config
 from .utils import tokenize
+from .profiling import span
 
 logger = logging.getLogger(__name__)
 
@@ -35,8 +36,10 @@ class HybridRetriever:
         # Improved tokenizer: word regex + lowercase + basic stopword removal
         return tokenize(text)
 
-    def _vector_search(self, query: str, k: int) -> List[Tuple[str, float]]:
-        results = self.vs.similarity_search_with_score(query, k=k)
+    def _vector_search(self, query: str, k: int, timeout: Optional[float] = None) -> List[Tuple[str, float]]:
+        # Embed the query here rather than inside Chroma so the deadline reaches the embedding call
+        vec = self.embeddings.embed_query(query, timeout=timeout)
+        results = self.vs.similarity_search_by_vector_with_relevance_scores(vec, k=k)
         pairs: List[Tuple[str, float]] = []
         for doc, score in results:
             # Chroma returns smaller score for closer distance in some configs; convert to similarity
@@ -53,11 +56,14 @@ class HybridRetriever:
         return pairs
 
     def _bm25_search(self, query: str, k: int) -> List[Tuple[str, float]]:
-        toks = self._tokenize(query)
-        scores = self.bm25.get_scores(toks)
-        # Pair with ids
-        id_scores = list(zip(self.corpus_ids, scores))
-        id_scores.sort(key=lambda x: x[1], reverse=True)
+        with span("bm25.tokenize"):
+            toks = self._tokenize(query)
+        with span("bm25.get_scores"):
+            scores = self.bm25.get_scores(toks)
+        with span("bm25.rank"):
+            # Pair with ids
+            id_scores = list(zip(self.corpus_ids, scores))
+            id_scores.sort(key=lambda x: x[1], reverse=True)
         return id_scores[:k]
 
     def _rrf_fuse(self, ranked_lists: List[List[Tuple[str, float]]], k: int, rrf_k: int) -> List[Tuple[str, float]]:
@@ -69,11 +75,18 @@ class HybridRetriever:
         fused = sorted(agg.items(), key=lambda x: x[1], reverse=True)
         return fused[:k]
 
-    def search(self, query: str) -> List[Dict]:
-        vect = self._vector_search(query, k=config.VECTOR_TOP_K)
-        kw = self._bm25_search(query, k=config.BM25_TOP_K)
+    def search(self, query: str, use_vector: bool = True, timeout: Optional[float] = None) -> List[Dict]:
+        # use_vector=False skips the embedding round-trip (BM25 only) when a deadline is tight;
+        # timeout (seconds) bounds the query embedding's queue wait and upstream call
+        vect = []
+        if use_vector:
+            with span("vector_search"):
+                vect = self._vector_search(query, k=config.VECTOR_TOP_K, timeout=timeout)
+        with span("bm25"):
+            kw = self._bm25_search(query, k=config.BM25_TOP_K)
         logger.debug({"vector": vect[:3], "bm25": kw[:3]})
-        fused = self._rrf_fuse([vect, kw], k=config.FUSION_K, rrf_k=config.RRF_K)
+        with span("rrf_fuse"):
+            fused = self._rrf_fuse([vect, kw], k=config.FUSION_K, rrf_k=config.RRF_K)
         logger.debug({"fused": fused[:5]})
         results: List[Dict] = []
         for doc_id, score in fused:
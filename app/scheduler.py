@@ -0,0 +1,245 @@
+"""Admission control and priority scheduling for upstream LLM / embedding calls.
+
+Every chat and embedding call takes a slot from one process-wide scheduler
+before hitting OpenAI. Slots are limited by two token buckets (requests/min and
+tokens/min); when both have room the highest-priority waiter goes first, so
+interactive answers are not stuck behind critic/revise or RAGAS evaluation.
+When the queue is deeper than LLM_MAX_QUEUE (or a waiter would wait longer than
+LLM_QUEUE_TIMEOUT_S) QueueFullError is raised and the API answers 429 with
+Retry-After instead of letting the request time out.
+
+Set LLM_SCHEDULER_STATE to a file path to share the buckets between worker
+processes (e.g. gunicorn workers on one host); ordering stays per process.
+"""
+
+import heapq
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from . import config
+
+# Lower value is served first
+PRIORITIES = {
+    "interactive": 0,  # rewrite_query, generate, query embeddings
+    "refine": 1,       # critic, revise
+    "background": 2,   # RAGAS evaluation, ingestion
+}
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a call cannot be admitted in time; retry_after is in seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English; avoids a tiktoken round-trip per call
+    return max(1, len(text) // 4)
+
+
+class _LocalBuckets:
+    """RPM/TPM buckets held in memory. A limit of 0 means unlimited."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        now = time.monotonic()
+        self._state = {"req": float(rpm), "tok": float(tpm), "ts": now}
+
+    @staticmethod
+    def _refill(state: Dict[str, float], rpm: int, tpm: int, now: float) -> None:
+        dt = max(0.0, now - state["ts"])
+        state["req"] = min(float(rpm), state["req"] + dt * rpm / 60.0)
+        state["tok"] = min(float(tpm), state["tok"] + dt * tpm / 60.0)
+        state["ts"] = now
+
+    def _take(self, state: Dict[str, float], tokens: int, now: float) -> float:
+        """Debit one request + tokens if both fit; else return seconds until they will."""
+        self._refill(state, self.rpm, self.tpm, now)
+        # A single call larger than the whole TPM budget is admitted once the bucket is full
+        need_tok = min(tokens, self.tpm) if self.tpm else 0
+        wait = 0.0
+        if self.rpm and state["req"] < 1.0:
+            wait = max(wait, (1.0 - state["req"]) * 60.0 / self.rpm)
+        if self.tpm and state["tok"] < need_tok:
+            wait = max(wait, (need_tok - state["tok"]) * 60.0 / self.tpm)
+        if wait > 0:
+            return wait
+        if self.rpm:
+            state["req"] -= 1.0
+        if self.tpm:
+            state["tok"] -= tokens
+        return 0.0
+
+    def try_take(self, tokens: int) -> float:
+        return self._take(self._state, tokens, time.monotonic())
+
+    def adjust(self, tokens: int) -> None:
+        # Settle the difference between estimated and actual usage (may go negative)
+        if self.tpm and tokens:
+            self._state["tok"] = min(float(self.tpm), self._state["tok"] - tokens)
+
+
+class _FileBuckets(_LocalBuckets):
+    """Same buckets, persisted in a small JSON file guarded by flock (one host, many workers)."""
+
+    def __init__(self, rpm: int, tpm: int, path: str):
+        super().__init__(rpm, tpm)
+        self.path = path
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+
+    @contextmanager
+    def _locked(self) -> Iterator[Dict[str, float]]:
+        import fcntl
+
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}
+                now = time.time()
+                if not {"req", "tok", "ts"} <= set(state):
+                    state = {"req": float(self.rpm), "tok": float(self.tpm), "ts": now}
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def try_take(self, tokens: int) -> float:
+        # Wall clock, since monotonic clocks are not comparable across processes
+        with self._locked() as state:
+            return self._take(state, tokens, time.time())
+
+    def adjust(self, tokens: int) -> None:
+        if self.tpm and tokens:
+            with self._locked() as state:
+                state["tok"] = min(float(self.tpm), state["tok"] - tokens)
+
+
+class LLMScheduler:
+    def __init__(self, rpm: int = 0, tpm: int = 0, max_queue: int = 64,
+                 queue_timeout: float = 30.0, state_path: Optional[str] = None):
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.buckets = _FileBuckets(rpm, tpm, state_path) if state_path else _LocalBuckets(rpm, tpm)
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._waits: Dict[str, Deque[float]] = {p: deque(maxlen=1000) for p in PRIORITIES}
+        self._counters = {"granted": 0, "rejected": 0, "timed_out": 0}
+
+    def retry_after(self) -> float:
+        # Rough guess: time to drain the current queue at the configured request rate
+        rpm = self.buckets.rpm
+        return max(1.0, len(self._heap) * 60.0 / rpm) if rpm else 1.0
+
+    def admit(self) -> None:
+        """Fail fast at the API edge if the queue is already over its bound."""
+        with self._cond:
+            if len(self._heap) >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise QueueFullError("LLM queue is full", self.retry_after())
+
+    def acquire(self, priority: str = "interactive", tokens: int = 1, timeout: Optional[float] = None) -> float:
+        """Block until a slot is granted; returns the time waited in seconds."""
+        prio = PRIORITIES.get(priority, PRIORITIES["interactive"])
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.monotonic()
+        with self._cond:
+            self.admit()
+            entry = (prio, next(self._seq))
+            heapq.heappush(self._heap, entry)
+            try:
+                while True:
+                    wait = None
+                    if self._heap[0] == entry:
+                        wait = self.buckets.try_take(tokens)
+                        if wait == 0.0:
+                            break
+                    remaining = timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        self._counters["timed_out"] += 1
+                        raise QueueFullError("Timed out waiting for LLM capacity", self.retry_after())
+                    # Non-head waiters sleep until notified; the head sleeps until the bucket refills
+                    self._cond.wait(min(wait, remaining) if wait else remaining)
+            finally:
+                self._heap.remove(entry)
+                heapq.heapify(self._heap)
+                self._cond.notify_all()
+            waited = time.monotonic() - start
+            self._counters["granted"] += 1
+            self._waits[priority if priority in PRIORITIES else "interactive"].append(waited)
+        return waited
+
+    def settle(self, estimated: int, actual: Optional[int]) -> None:
+        if actual is not None and actual != estimated:
+            with self._cond:
+                self.buckets.adjust(actual - estimated)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            depth_by = {p: 0 for p in PRIORITIES}
+            names = {v: k for k, v in PRIORITIES.items()}
+            for prio, _ in self._heap:
+                depth_by[names[prio]] += 1
+            waits = {}
+            for p, dq in self._waits.items():
+                vals = sorted(dq)
+                if not vals:
+                    waits[p] = {"count": 0}
+                    continue
+                waits[p] = {
+                    "count": len(vals),
+                    "mean_ms": round(1000.0 * sum(vals) / len(vals), 2),
+                    "p95_ms": round(1000.0 * vals[min(len(vals) - 1, math.ceil(0.95 * len(vals)) - 1)], 2),
+                    "max_ms": round(1000.0 * vals[-1], 2),
+                }
+            return {
+                "queue_depth": len(self._heap),
+                "queue_depth_by_priority": depth_by,
+                "max_queue": self.max_queue,
+                "rpm_limit": self.buckets.rpm,
+                "tpm_limit": self.buckets.tpm,
+                "wait": waits,
+                **self._counters,
+            }
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler(
+                    rpm=config.LLM_RPM_LIMIT,
+                    tpm=config.LLM_TPM_LIMIT,
+                    max_queue=config.LLM_MAX_QUEUE,
+                    queue_timeout=config.LLM_QUEUE_TIMEOUT_S,
+                    state_path=config.LLM_SCHEDULER_STATE or None,
+                )
+    return _scheduler
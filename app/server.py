@@ -1,15 +1,51 @@
 from flask import Flask, request, jsonify
+import logging
 import os
+from typing import TYPE_CHECKING
 
-from .ingest import ingest as run_ingest
-from .graph import QAGraph
+from .scheduler import QueueFullError, get_scheduler
 from . import config
-from .utils import setup_logging
+from . import profiling
+from .admin import admin as admin_blueprint
+from .profiling import span
+from .utils import parse_deadline_ms, setup_logging
 from .web import ui as ui_blueprint
 
+if TYPE_CHECKING:
+    from .graph import QAGraph
+
+# LangGraph/LangChain/Chroma are imported on first use (ingest or the first question),
+# so a process serving only /health starts fast and stays small.
+
 app = Flask(__name__, template_folder="templates")
 app.register_blueprint(ui_blueprint)
+app.register_blueprint(admin_blueprint)
 setup_logging()
+if not config.ADMIN_TOKEN:
+    logging.getLogger(__name__).warning(
+        "ADMIN_TOKEN is unset: /admin/profile is disabled and /admin/slow-requests is unauthenticated")
+
+
+def _traced() -> bool:
+    return not (request.path.startswith("/admin") or request.path.startswith("/static"))
+
+
+@app.before_request
+def _begin_trace():
+    if _traced():
+        profiling.begin_request(f"{request.method} {request.path}")
+
+
+@app.after_request
+def _end_trace(response):
+    profiling.end_request(response.status_code)
+    return response
+
+
+@app.teardown_request
+def _abort_trace(exc):
+    # after_request is skipped on unhandled errors; still close the trace
+    profiling.end_request(500)
 
 # Ensure OPENAI_API_KEY is available for libraries like RAGAS that may not honor alternative names
 if not os.getenv("OPENAI_API_KEY") and os.getenv("OPEN_AI_API_KEY"):
@@ -21,12 +57,14 @@ def ensure_indexes():
     # Build indexes if missing
     corpus_path = os.path.join("data", "corpus.json")
     if not os.path.exists(corpus_path) or not os.path.isdir(config.CHROMA_DIR):
+        from .ingest import ingest as run_ingest
         run_ingest(reset=False)
 
 
-def get_graph() -> QAGraph:
+def get_graph() -> "QAGraph":
     global _graph
     if _graph is None:
+        from .graph import QAGraph
         ensure_indexes()
         _graph = QAGraph()
     return _graph
@@ -37,11 +75,18 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/scheduler")
+def scheduler_stats():
+    # Upstream LLM queue depth, wait times and admission counters
+    return jsonify(get_scheduler().stats())
+
+
 @app.post("/ingest")
 def ingest_endpoint():
     body = request.get_json(silent=True) or {}
     reset = bool(body.get("reset", True))
     try:
+        from .ingest import ingest as run_ingest
         stats = run_ingest(reset=reset)
         # reset cached graph so it rebuilds with fresh stores
         global _graph
@@ -59,9 +104,17 @@ def ask():
     if not question:
         return jsonify({"error": "Missing 'question'"}), 400
     try:
+        deadline_ms = parse_deadline_ms(body.get("deadline_ms"))
+    except ValueError:
+        return jsonify({"error": "'deadline_ms' must be a positive number (0 for no deadline)"}), 400
+    try:
+        get_scheduler().admit()
         graph = get_graph()
-        result = graph.run(question, filters=filters)
-        return jsonify(result)
+        result = graph.run(question, filters=filters, deadline_ms=deadline_ms)
+        with span("serialize"):
+            return jsonify(result)
+    except QueueFullError as e:
+        return jsonify({"status": "busy", "error": str(e)}), 429, {"Retry-After": e.retry_after_header}
     except Exception as e:
         return jsonify({"status": "error", "error": str(e)}), 500
 
@@ -1,6 +1,7 @@
 import logging
+import math
 import re
-from typing import List
+from typing import Any, List, Optional
 
 from . import config
 
@@ -10,6 +11,25 @@ def setup_logging():
     logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 
+def parse_deadline_ms(value: Any) -> Optional[float]:
+    """Turn a request's deadline_ms into a budget in ms, or None for no deadline.
+
+    Missing/null falls back to REQUEST_DEADLINE_MS and an explicit 0 means no deadline.
+    Raises ValueError for anything else that is not a positive, finite number.
+    """
+    if value is None or value == "":
+        value = config.REQUEST_DEADLINE_MS
+    if isinstance(value, bool):
+        raise ValueError("deadline_ms must be a number")
+    try:
+        ms = float(value)
+    except TypeError:
+        raise ValueError("deadline_ms must be a number") from None
+    if not math.isfinite(ms) or ms < 0:
+        raise ValueError("deadline_ms must be a positive, finite number")
+    return ms or None
+
+
 _word_re = re.compile(r"[A-Za-z0-9']+")
 _stop = {
     # minimal English stopword set
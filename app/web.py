@@ -1,24 +1,34 @@
 from flask import Blueprint, render_template, request, jsonify, make_response
 import os
+import time
+from typing import TYPE_CHECKING
 
-from .graph import QAGraph
-from .metrics import compute_ragas_metrics, ragas_available
-from .ingest import ingest as run_ingest
+from .profiling import span
+from .scheduler import QueueFullError, get_scheduler
+from .utils import parse_deadline_ms
 from . import config
 
+if TYPE_CHECKING:
+    from .graph import QAGraph
+
 ui = Blueprint("ui", __name__, static_folder="static", template_folder="templates")
 
 _graph = None
+# Running estimate (ms) of a RAGAS evaluation, used to skip it when a deadline can't cover it.
+# Starts as a guess; the first real evaluation replaces it, later ones feed an EWMA.
+_ragas_cost = {"ms": 3000.0, "observed": False}
 
 def ensure_indexes():
     corpus_path = os.path.join("data", "corpus.json")
     if not os.path.exists(corpus_path) or not os.path.isdir(config.CHROMA_DIR):
+        from .ingest import ingest as run_ingest
         run_ingest(reset=False)
 
 
-def _get_graph():
+def _get_graph() -> "QAGraph":
     global _graph
     if _graph is None:
+        from .graph import QAGraph
         ensure_indexes()
         _graph = QAGraph()
     return _graph
@@ -40,12 +50,37 @@ def qa_endpoint():
     filters = data.get("filters") or None
     if not question:
         return jsonify({"error": "Missing question"}), 400
-    g = _get_graph()
-    result = g.run(question, filters=filters)
+    try:
+        deadline_ms = parse_deadline_ms(data.get("deadline_ms"))
+    except ValueError:
+        return jsonify({"error": "deadline_ms must be a positive number (0 for no deadline)"}), 400
+    deadline = time.monotonic() + deadline_ms / 1000.0 if deadline_ms else None
+    try:
+        get_scheduler().admit()
+        g = _get_graph()
+        result = g.run(question, filters=filters, deadline_ms=deadline_ms)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": e.retry_after_header}
 
     # Compute RAGAS metrics (optional if package is installed and configured)
+    from .metrics import compute_ragas_metrics, ragas_available
     ok, reason = ragas_available()
-    metrics = compute_ragas_metrics(question, result.get("answer", ""), result.get("contexts", [])) if ok else None
+    timeout = None
+    if ok and deadline is not None:
+        remaining_ms = (deadline - time.monotonic()) * 1000.0
+        if remaining_ms < _ragas_cost["ms"]:
+            ok, reason = False, "skipped: deadline"
+        else:
+            timeout = remaining_ms / 1000.0
+    with span("ragas"):
+        start = time.perf_counter()
+        metrics = compute_ragas_metrics(question, result.get("answer", ""), result.get("contexts", []),
+                                        timeout=timeout) if ok else None
+    if metrics is not None:
+        elapsed = (time.perf_counter() - start) * 1000.0
+        _ragas_cost["ms"] = 0.8 * _ragas_cost["ms"] + 0.2 * elapsed if _ragas_cost["observed"] else elapsed
+        _ragas_cost["observed"] = True
     status = "ok" if (metrics is not None) else (reason or "unavailable")
-    return jsonify({"result": result, "metrics": metrics, "metrics_status": status })
+    with span("serialize"):
+        return jsonify({"result": result, "metrics": metrics, "metrics_status": status })
 
@@ -1,10 +1,30 @@
 import json
 import os
 
+import pytest
+
 # Make sure OPENAI_API_KEY is not required for basic endpoints
 os.environ.pop("OPENAI_API_KEY", None)
 
 from app.server import app
+from app import config
+
+
+@pytest.fixture
+def fake_llm(monkeypatch, tmp_path):
+    # Serve /qa against the bundled fake OpenAI server from a scratch data dir
+    from app.fake_openai import start_server
+    import app.web as web
+
+    server, base_url = start_server()
+    monkeypatch.setattr(config, "OPENAI_API_KEY", "sk-fake", raising=False)
+    monkeypatch.setattr(config, "OPENAI_BASE_URL", base_url, raising=False)
+    monkeypatch.setattr(config, "KNOWLEDGE_JSON_PATH", os.path.abspath(config.KNOWLEDGE_JSON_PATH), raising=False)
+    monkeypatch.setattr(web, "_graph", None, raising=False)
+    monkeypatch.chdir(tmp_path)
+    yield base_url
+    server.shutdown()
+
 
 def test_health():
     client = app.test_client()
@@ -14,7 +34,7 @@ def test_health():
     assert data.get("status") == "ok"
 
 
-def test_qa_basic():
+def test_qa_basic(fake_llm):
     client = app.test_client()
     # Ensure indexes exist (server lazy-loads, but this warms paths)
     payload = {"question": "I have trouble sleeping; what should I try?"}
@@ -26,4 +46,39 @@ def test_qa_basic():
     assert "answer" in result
     # contexts should be returned
     assert isinstance(result.get("contexts", []), list)
+    assert {"rewrite_query", "retrieve", "generate", "critic"} <= set(result.get("timings", {}))
+
+
+def test_qa_ragas_respects_deadline(monkeypatch):
+    from types import SimpleNamespace
 
+    import app.metrics as metrics
+    import app.web as web
+
+    calls = []
+    graph = SimpleNamespace(run=lambda q, filters=None, deadline_ms=None: {"answer": "a [X]", "contexts": []})
+    monkeypatch.setattr(web, "_get_graph", lambda: graph)
+    monkeypatch.setattr(metrics, "ragas_available", lambda: (True, "ok"))
+    monkeypatch.setattr(metrics, "compute_ragas_metrics",
+                        lambda q, a, c, timeout=None: calls.append(timeout) or {"faithfulness": 1.0})
+    client = app.test_client()
+    payload = {"question": "I have trouble sleeping; what should I try?", "deadline_ms": 5000}
+
+    # Budget left after the graph can't cover an evaluation
+    monkeypatch.setattr(web, "_ragas_cost", {"ms": 10_000.0, "observed": True})
+    data = client.post("/qa", json=payload).get_json()
+    assert data["metrics"] is None and data["metrics_status"] == "skipped: deadline"
+    assert calls == []
+
+    # Otherwise RAGAS runs bounded by what is left of the deadline
+    monkeypatch.setattr(web, "_ragas_cost", {"ms": 1.0, "observed": True})
+    data = client.post("/qa", json=payload).get_json()
+    assert data["metrics_status"] == "ok"
+    assert len(calls) == 1 and 0 < calls[0] <= 5.0
+
+
+def test_ask_rejects_bad_deadline():
+    client = app.test_client()
+    for bad in (-5, "abc", {"ms": 1}, True, "nan", "inf"):
+        resp = client.post("/ask", json={"question": "sleep?", "deadline_ms": bad})
+        assert resp.status_code == 400, bad
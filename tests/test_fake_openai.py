@@ -0,0 +1,147 @@
+import base64
+import itertools
+import json
+import os
+import struct
+import threading
+import time
+
+from app.fake_openai import LatencyModel, create_app, fake_embedding
+import app.loadtest as loadtest
+from app.loadtest import build_report, percentile, run_load
+
+
+def test_embeddings_deterministic_and_base64():
+    client = create_app().test_client()
+    body = {"model": "text-embedding-3-small", "input": ["sleep schedule", "sleep schedule", "hot flashes"]}
+    data = client.post("/v1/embeddings", json=body).get_json()["data"]
+    assert data[0]["embedding"] == data[1]["embedding"]
+    assert data[0]["embedding"] != data[2]["embedding"]
+
+    body["encoding_format"] = "base64"
+    raw = base64.b64decode(client.post("/v1/embeddings", json=body).get_json()["data"][0]["embedding"])
+    decoded = struct.unpack(f"<{len(raw) // 4}f", raw)
+    assert all(abs(a - b) < 1e-6 for a, b in zip(decoded, fake_embedding("sleep schedule")))
+
+
+def test_chat_critic_and_citations():
+    client = create_app().test_client()
+    critic = {"messages": [{"role": "user", "content": "Output a strict JSON object with keys: needs_revision"}]}
+    out = client.post("/v1/chat/completions", json=critic).get_json()
+    assert json.loads(out["choices"][0]["message"]["content"])["needs_revision"] is False
+
+    ctx = "Question: sleep?\n\nContext:\n[SLEEP_001]\nRecommendation: Keep a schedule.\n"
+    out = client.post("/v1/chat/completions", json={"messages": [{"role": "user", "content": ctx}]}).get_json()
+    assert "[SLEEP_001]" in out["choices"][0]["message"]["content"]
+
+
+def test_chat_streaming():
+    client = create_app().test_client()
+    body = {"stream": True, "messages": [{"role": "user", "content": "[SLEEP_001]\nRecommendation: Rest."}]}
+    resp = client.post("/v1/chat/completions", json=body)
+    events = [line[len("data: "):] for line in resp.get_data(as_text=True).splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    text = "".join(json.loads(e)["choices"][0]["delta"].get("content", "") for e in events[:-1])
+    assert "[SLEEP_001]" in text
+
+
+def test_error_rate_and_latency():
+    client = create_app(error_rate=1.0, seed=1).test_client()
+    resp = client.post("/v1/chat/completions", json={"messages": []})
+    assert resp.status_code in (429, 500)
+    assert "error" in resp.get_json()
+    assert LatencyModel(100, 20, "uniform", seed=3).sample() == LatencyModel(100, 20, "uniform", seed=3).sample()
+
+
+def test_percentile_nearest_rank():
+    vals = list(range(1, 101))
+    assert percentile(vals, 50) == 50
+    assert percentile(vals, 99) == 99
+    assert percentile([5.0], 95) == 5.0
+
+
+def test_build_report_counts_and_nodes():
+    results = [
+        ("/ask", 200, 10.0, {"retrieve": 2.0, "generate": 6.0}),
+        ("/ask", 200, 30.0, {"retrieve": 4.0, "generate": 20.0}),
+        ("/ask", 429, 1.0, {}),
+        ("/qa", 500, 5.0, {"generate": 99.0}),
+    ]
+    report = build_report(results, wall_s=2.0, concurrency=2)
+    assert (report["requests"], report["errors"], report["throughput_rps"]) == (4, 2, 2.0)
+    ask = report["endpoints"]["/ask"]
+    assert ask["status_counts"] == {"200": 2, "429": 1}
+    assert ask["throughput_rps"] == 1.5
+    # Latency and node timings only cover successful requests
+    assert ask["latency"]["count"] == 2 and ask["latency"]["max_ms"] == 30.0
+    assert ask["nodes"]["generate"]["mean_ms"] == 13.0 and ask["nodes"]["retrieve"]["count"] == 2
+    assert report["endpoints"]["/qa"]["nodes"] == {} and report["endpoints"]["/qa"]["latency"] == {"count": 0}
+
+
+def test_run_load_with_stub_sender():
+    qa_replies = iter([
+        (200, {"result": {"timings": {"generate": 20.0}}}),
+        (429, None),
+        RuntimeError("connection reset"),
+    ])
+    lock = threading.Lock()
+    payloads = []
+
+    def send(endpoint, payload):
+        with lock:
+            payloads.append(payload)
+            reply = (200, {"timings": {"generate": 10.0}}) if endpoint == "/ask" else next(qa_replies)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    report = run_load(send, ["/ask", "/qa"], ["q"], concurrency=2, requests=6, warmup=0, deadline_ms=800)
+    assert report["requests"] == 6 and report["errors"] == 2
+    assert report["throughput_rps"] > 0
+    qa = report["endpoints"]["/qa"]
+    # A sender exception is recorded as status 0
+    assert qa["status_counts"] == {"200": 1, "429": 1, "0": 1}
+    assert qa["nodes"]["generate"] == {"count": 1, "mean_ms": 20.0, "p50_ms": 20.0, "p95_ms": 20.0,
+                                       "p99_ms": 20.0, "max_ms": 20.0}
+    assert report["endpoints"]["/ask"]["nodes"]["generate"]["count"] == 3
+    assert all(p == {"question": "q", "deadline_ms": 800} for p in payloads)
+
+
+def test_main_exit_codes(monkeypatch, capsys):
+    statuses = itertools.cycle([200, 200, 200, 500])
+
+    def fake_http_sender(base_url, timeout=120.0):
+        lock = threading.Lock()
+
+        def send(endpoint, payload):
+            time.sleep(0.02)
+            with lock:
+                return next(statuses), {"timings": {}}
+
+        return send
+
+    monkeypatch.setattr(loadtest, "http_sender", fake_http_sender)
+    base = ["--url", "http://stub", "--requests", "8", "--concurrency", "2"]
+    assert loadtest.main(base) == 0
+    assert loadtest.main(base + ["--fail-p95-ms", "10000", "--fail-error-rate", "0.5"]) == 0
+    assert loadtest.main(base + ["--fail-p95-ms", "5"]) == 1
+    assert loadtest.main(base + ["--fail-error-rate", "0.1"]) == 1
+    assert '"requests": 8' in capsys.readouterr().out
+
+
+def test_use_fake_llm_overrides_the_key_ragas_sees(monkeypatch, tmp_path):
+    from app import config
+    from app.metrics import ragas_available
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-real")
+    monkeypatch.setenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    for name in ("OPENAI_API_KEY", "OPENAI_BASE_URL", "KNOWLEDGE_JSON_PATH"):
+        monkeypatch.setattr(config, name, getattr(config, name), raising=False)
+    monkeypatch.chdir(tmp_path)
+    server = loadtest.use_fake_llm(workdir=str(tmp_path))
+    try:
+        assert os.environ["OPENAI_API_KEY"] == config.OPENAI_API_KEY == "sk-fake"
+        assert os.environ["OPENAI_BASE_URL"] == config.OPENAI_BASE_URL
+        assert ragas_available()[1] != "OPENAI_API_KEY missing"
+    finally:
+        server.shutdown()
@@ -0,0 +1,211 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.graph import QAGraph
+
+CONTEXTS = [
+    {"id": "SLEEP_001", "score": 0.1, "metadata": {"recommendation_id": "SLEEP_001"},
+     "text": "Symptom: Insomnia\nCategory: Sleep\nRecommendation: Keep a consistent sleep schedule.\nExplanation: x\n"},
+    {"id": "SLEEP_002", "score": 0.05, "metadata": {"recommendation_id": "SLEEP_002"},
+     "text": "Symptom: Insomnia\nCategory: Sleep\nRecommendation: Avoid screens before bed.\nExplanation: y\n"},
+]
+
+
+class FakeChat:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def invoke(self, messages, priority="interactive", timeout=None, **kwargs):
+        self.calls.append(priority)
+        if timeout is not None and timeout < self.delay:
+            time.sleep(timeout)
+            raise TimeoutError("fake timeout")
+        time.sleep(self.delay)
+        text = messages[-1].content
+        if "needs_revision" in text:
+            return SimpleNamespace(content=json.dumps({"needs_revision": False, "reasons": "ok"}))
+        return SimpleNamespace(content="answer [SLEEP_001]")
+
+
+def _graph(chat):
+    g = QAGraph.__new__(QAGraph)
+    g.chat = chat
+    g.retriever = SimpleNamespace(search=lambda q, use_vector=True, timeout=None: list(CONTEXTS))
+    g.stage_cost_ms = {"rewrite_query": 50.0, "retrieve": 5.0, "generate": 100.0, "critic": 50.0, "revise": 100.0}
+    g._cost_observed = set(g.stage_cost_ms)
+    g._cost_lock = threading.Lock()
+    g.graph = g._build()
+    return g
+
+
+def test_no_deadline_runs_every_stage():
+    res = _graph(FakeChat()).run("trouble sleeping?")
+    assert res["skipped"] == []
+    assert res["answer"] == "answer [SLEEP_001]"
+
+
+def test_tight_deadline_skips_rewrite_and_critic():
+    chat = FakeChat(delay=0.08)
+    res = _graph(chat).run("trouble sleeping?", deadline_ms=120)
+    assert "rewrite_query" in res["skipped"]
+    assert "critic" in res["skipped"]
+    assert res["answer"] == "answer [SLEEP_001]"
+    assert chat.calls == ["interactive"]
+
+
+def test_slow_llm_falls_back_to_extractive_answer():
+    start = time.monotonic()
+    res = _graph(FakeChat(delay=1.0)).run("trouble sleeping?", deadline_ms=300)
+    assert time.monotonic() - start < 0.9
+    assert "generate" in res["skipped"]
+    assert "[SLEEP_001]" in res["answer"] and "Keep a consistent sleep schedule." in res["answer"]
+
+
+def test_extractive_answer_without_budget():
+    res = _graph(FakeChat()).run("trouble sleeping?", deadline_ms=1)
+    assert {"rewrite_query", "vector_search", "full_context", "generate", "critic"} <= set(res["skipped"])
+    assert res["answer"].startswith("Top recommendations")
+
+
+def test_congested_scheduler_falls_back_to_raw_question(monkeypatch):
+    import app.llm
+    from app.llm import ScheduledChat
+    from app.scheduler import LLMScheduler
+
+    # One request per minute, already spent: every acquire would wait ~60s
+    sched = LLMScheduler(rpm=1, queue_timeout=30.0)
+    sched.acquire("interactive", 1)
+    monkeypatch.setattr(app.llm, "get_scheduler", lambda: sched)
+    inner = FakeChat()
+    g = _graph(ScheduledChat(inner))
+    g.stage_cost_ms.update(retrieve=5.0, generate=300.0)
+
+    start = time.monotonic()
+    res = g.run("trouble sleeping?", deadline_ms=700)
+    elapsed = time.monotonic() - start
+    assert elapsed < 1.0
+    assert {"rewrite_query", "generate"} <= set(res["skipped"])
+    # The rewrite gave up early enough to leave generate its expected budget
+    assert res["timings"]["rewrite_query"] < 700 - 305 + 50
+    assert res["answer"].startswith("Top recommendations")
+    assert inner.calls == []
+
+
+def test_generate_fallback_is_logged_and_narrow(caplog):
+    res = _graph(FakeChat(delay=1.0)).run("trouble sleeping?", deadline_ms=300)
+    assert "generate" in res["skipped"]
+    assert "extractive" in caplog.text and "TimeoutError" in caplog.text
+
+    class BrokenChat(FakeChat):
+        def invoke(self, messages, priority="interactive", timeout=None, **kwargs):
+            if "Instructions:" in messages[-1].content:
+                raise KeyError("bug")
+            return super().invoke(messages, priority, timeout, **kwargs)
+
+    # A programming error is not a capacity problem; it should not be papered over
+    with pytest.raises(KeyError):
+        _graph(BrokenChat()).run("trouble sleeping?", deadline_ms=5000)
+
+
+class ScriptedChat(FakeChat):
+    """FakeChat whose critic/revise calls follow a script of replies or exceptions."""
+
+    def __init__(self, critic=None, revise=None, delay=0.0):
+        super().__init__(delay)
+        self.script = {"critic": critic, "revise": revise}
+
+    def invoke(self, messages, priority="interactive", timeout=None, **kwargs):
+        text = messages[-1].content
+        stage = "revise" if "Revise it" in text else "critic" if "needs_revision" in text else None
+        reply = self.script.get(stage) if stage else None
+        if reply is None:
+            return super().invoke(messages, priority, timeout, **kwargs)
+        self.calls.append(priority)
+        if isinstance(reply, Exception):
+            raise reply
+        return SimpleNamespace(content=reply)
+
+
+def test_shed_critic_and_revise_are_reported_as_skipped():
+    from app.scheduler import QueueFullError
+
+    res = _graph(ScriptedChat(critic=QueueFullError("full", 1.0))).run("trouble sleeping?")
+    assert res["skipped"] == ["critic"]
+    assert res["answer"] == "answer [SLEEP_001]"
+
+    chat = ScriptedChat(critic=json.dumps({"needs_revision": True, "reasons": "x"}), revise=QueueFullError("full", 1.0))
+    res = _graph(chat).run("trouble sleeping?")
+    assert res["skipped"] == ["revise"]
+    assert res["answer"] == "answer [SLEEP_001]"
+    # The unrevised draft is not sent back to the critic
+    assert chat.calls == ["interactive", "interactive", "refine", "refine"]
+
+
+def test_critic_and_revise_timeouts_keep_the_draft():
+    import openai
+
+    res = _graph(ScriptedChat(critic=TimeoutError("slow critic"))).run("trouble sleeping?", deadline_ms=1000)
+    assert res["skipped"] == ["critic"]
+    assert res["answer"] == "answer [SLEEP_001]"
+
+    chat = ScriptedChat(critic=json.dumps({"needs_revision": True, "reasons": "x"}),
+                        revise=openai.APITimeoutError(request=None))
+    res = _graph(chat).run("trouble sleeping?", deadline_ms=1000)
+    assert res["skipped"] == ["revise"]
+    assert res["answer"] == "answer [SLEEP_001]"
+
+    # Without a deadline a timeout is a real failure, not a planned skip
+    with pytest.raises(TimeoutError):
+        _graph(ScriptedChat(critic=TimeoutError("slow critic"))).run("trouble sleeping?")
+
+
+def test_congested_query_embedding_falls_back_to_bm25():
+    from app.scheduler import QueueFullError
+
+    calls = []
+
+    def search(q, use_vector=True, timeout=None):
+        calls.append((use_vector, timeout))
+        if use_vector:
+            raise QueueFullError("Timed out waiting for LLM capacity", 1.0)
+        return list(CONTEXTS)
+
+    g = _graph(FakeChat())
+    g.retriever = SimpleNamespace(search=search)
+    res = g.run("trouble sleeping?", deadline_ms=1000)
+    assert "vector_search" in res["skipped"]
+    assert res["answer"] == "answer [SLEEP_001]"
+    # The vector attempt was bounded by the request's remaining budget
+    assert calls[0][0] is True and 0 < calls[0][1] <= 1.0
+    assert calls[1] == (False, None)
+
+
+def test_first_sample_is_blended_with_the_default():
+    g = _graph(FakeChat())
+    g._cost_observed = set()
+    g.stage_cost_ms["critic"] = 900.0
+    g._observe("critic", 100.0)
+    assert g.stage_cost_ms["critic"] == 500.0
+    g._observe("critic", 100.0)
+    assert g.stage_cost_ms["critic"] == 420.0
+
+
+def test_stage_skipped_on_a_stale_estimate_is_retried():
+    g = _graph(FakeChat())
+    # As if one cold critic call had taken 5 s
+    g.stage_cost_ms["critic"] = 5000.0
+    runs = 0
+    while True:
+        runs += 1
+        res = g.run("trouble sleeping?", deadline_ms=1000)
+        if "critic" not in res["skipped"]:
+            break
+        assert runs < 30, "critic never retried"
+    assert runs > 1
+    # The real (fast) run pulls the estimate back down
+    assert g.stage_cost_ms["critic"] < 1000 * 0.8
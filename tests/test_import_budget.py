@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+# Modules that must stay out of a process that has not served a question yet
+HEAVY = ("langgraph", "langchain", "langchain_core", "langchain_openai", "langchain_community",
+         "chromadb", "ragas", "datasets", "pandas", "rank_bm25", "openai")
+# Generous default so slow CI machines pass; importing the heavy stack takes several seconds
+BUDGET_US = int(os.getenv("IMPORT_BUDGET_US", "1500000"))
+
+
+def _importtime(module: str):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=root, capture_output=True, text=True, check=True,
+    )
+    rows = {}
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cumulative, name = line[len("import time:"):].split("|")
+        rows[name.strip()] = int(cumulative)
+    return rows
+
+
+def test_server_import_stays_light():
+    rows = _importtime("app.server")
+    loaded = {name.split(".")[0] for name in rows}
+    assert not loaded & set(HEAVY), sorted(loaded & set(HEAVY))
+    assert rows["app.server"] < BUDGET_US, rows["app.server"]
@@ -16,7 +16,7 @@ def test_build_documents_chunking(monkeypatch):
     monkeypatch.setattr(config, "CHUNK_SIZE", 50, raising=False)
     monkeypatch.setattr(config, "CHUNK_OVERLAP", 10, raising=False)
 
-    docs = build_documents(kb)
+    docs = list(build_documents(kb))
     # Expect multiple chunks
     assert len(docs) >= 3
     # Each doc includes recommendation_id metadata
@@ -0,0 +1,97 @@
+import io
+import json
+import os
+
+import pytest
+
+from app import config
+from app.ingest import _iter_json_array, batched, build_documents, ingest, iter_knowledge_base, persist_corpus_json
+
+
+def _kb(n):
+    return [{
+        "symptom": f"S{i}",
+        "category": "Cat",
+        "recommendations": [{"recommendation_id": f"REC_{i:03d}", "recommendation_text": "x" * i, "explanation": "y"}],
+    } for i in range(n)]
+
+
+def test_iter_json_array_small_chunks():
+    kb = _kb(20)
+    text = json.dumps(kb, indent=2)
+    assert list(_iter_json_array(io.StringIO(text), chunk_size=7)) == kb
+    assert list(_iter_json_array(io.StringIO("[]"), chunk_size=1)) == []
+
+
+
+def test_iter_json_array_syntax_error_does_not_read_the_whole_file():
+    class CountingReader(io.StringIO):
+        consumed = 0
+
+        def read(self, size=-1):
+            out = super().read(size)
+            self.consumed += len(out)
+            return out
+
+    text = '[{"a": 1}, {"b" 2}, ' + '{"c": "%s"}, ' % ("x" * 100) * 10_000 + '{"d": 1}]'
+    f = CountingReader(text)
+    with pytest.raises(json.JSONDecodeError):
+        list(_iter_json_array(f, chunk_size=64))
+    assert f.consumed <= 64 * 4
+
+
+def test_iter_json_array_rejects_non_objects():
+    for text in ("[1.5]", '[{"a": 1}, "x"]', "[[1]]"):
+        with pytest.raises(ValueError, match="JSON objects"):
+            list(_iter_json_array(io.StringIO(text), chunk_size=1))
+
+
+
+def test_iter_knowledge_base_jsonl_rejects_non_objects(tmp_path):
+    path = tmp_path / "kb.jsonl"
+    path.write_text('{"symptom": "Insomnia"}\n[1]\n', encoding="utf-8")
+    with pytest.raises(ValueError, match="JSON objects.*line 2"):
+        list(iter_knowledge_base(str(path)))
+
+
+def test_iter_knowledge_base_json_and_jsonl(tmp_path):
+    kb = _kb(5)
+    p_json = tmp_path / "kb.json"
+    p_json.write_text(json.dumps(kb), encoding="utf-8")
+    p_jsonl = tmp_path / "kb.jsonl"
+    p_jsonl.write_text("\n".join(json.dumps(e) for e in kb) + "\n", encoding="utf-8")
+    assert list(iter_knowledge_base(str(p_json))) == kb
+    assert list(iter_knowledge_base(str(p_jsonl))) == kb
+
+
+def test_build_documents_is_lazy_and_corpus_streams(tmp_path):
+    docs = build_documents(iter(_kb(3)))
+    assert not isinstance(docs, list)
+    out = tmp_path / "data" / "corpus.json"
+    persist_corpus_json(docs, str(out))
+    data = json.loads(out.read_text(encoding="utf-8"))
+    assert [d["id"] for d in data] == ["REC_000", "REC_001", "REC_002"]
+    assert [len(b) for b in batched(range(5), 2)] == [2, 2, 1]
+
+
+def test_ingest_in_batches(monkeypatch, tmp_path):
+    from app.fake_openai import start_server
+
+    kb_path = tmp_path / "kb.json"
+    kb_path.write_text(json.dumps(_kb(7)), encoding="utf-8")
+    server, base_url = start_server()
+    monkeypatch.setattr(config, "OPENAI_API_KEY", "sk-fake", raising=False)
+    monkeypatch.setattr(config, "OPENAI_BASE_URL", base_url, raising=False)
+    monkeypatch.setattr(config, "KNOWLEDGE_JSON_PATH", str(kb_path), raising=False)
+    monkeypatch.setattr(config, "CHROMA_DIR", str(tmp_path / "chroma"), raising=False)
+    monkeypatch.setattr(config, "INGEST_BATCH_SIZE", 3, raising=False)
+    monkeypatch.chdir(tmp_path)
+    try:
+        stats = ingest(reset=True)
+    finally:
+        server.shutdown()
+    assert stats["documents"] == 7
+    assert stats["batches"] == 3
+    assert stats["peak_rss_mb"] > 0
+    with open(os.path.join("data", "corpus.json"), encoding="utf-8") as f:
+        assert len(json.load(f)) == 7
@@ -0,0 +1,71 @@
+import time
+
+from app import config, profiling
+from app.server import app
+
+
+def _busy_wait_for_profiler(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_span_tree_nests_and_slow_requests_are_kept(monkeypatch):
+    monkeypatch.setattr(config, "SLOW_REQUEST_MS", 1e-6, raising=False)
+    profiling.clear_slow_requests()
+    profiling.begin_request("POST /ask")
+    with profiling.span("retrieve"):
+        with profiling.span("bm25.get_scores"):
+            pass
+    profiling.end_request(200)
+    req = profiling.slow_requests()[0]
+    assert req["name"] == "POST /ask" and req["status"] == 200
+    retrieve = req["spans"]["children"][0]
+    assert retrieve["name"] == "retrieve"
+    assert retrieve["children"][0]["name"] == "bm25.get_scores"
+    # No trace outside a request: span is a cheap no-op
+    with profiling.span("orphan") as node:
+        assert node is None
+
+
+def test_sampler_collects_folded_stacks(monkeypatch):
+    profiling.sampler.start(sample_rate=1.0, duration_s=5, interval_ms=1)
+    try:
+        profiling.begin_request("POST /ask")
+        _busy_wait_for_profiler(0.1)
+        profiling.end_request(200)
+    finally:
+        profiling.sampler.stop()
+    stacks = profiling.sampler.folded()
+    assert profiling.sampler.status()["requests_sampled"] == 1
+    assert any("_busy_wait_for_profiler" in line for line in stacks)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+
+
+def test_admin_endpoints(monkeypatch):
+    client = app.test_client()
+    monkeypatch.setattr(config, "SLOW_REQUEST_MS", 1e-6, raising=False)
+    client.delete("/admin/slow-requests")
+    client.get("/health")
+    data = client.get("/admin/slow-requests?limit=5").get_json()
+    assert [r["name"] for r in data["requests"]] == ["GET /health"]
+
+    # The sampler stays off until an admin token is configured
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "", raising=False)
+    assert client.post("/admin/profile", json={"sample_rate": 0.5}).status_code == 403
+    assert client.get("/admin/profile").status_code == 403
+
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "s3cret", raising=False)
+    assert client.get("/admin/slow-requests").status_code == 403
+    assert client.get("/admin/slow-requests", headers={"X-Admin-Token": "s3cret"}).status_code == 200
+
+    auth = {"X-Admin-Token": "s3cret"}
+    resp = client.post("/admin/profile", json={"sample_rate": 0.5, "duration_s": 86400, "interval_ms": 0.01},
+                       headers=auth)
+    status = resp.get_json()
+    assert status["active"] is True
+    assert status["remaining_s"] <= profiling.MAX_PROFILE_DURATION_S
+    assert status["interval_ms"] == profiling.MIN_SAMPLE_INTERVAL_MS
+    assert client.delete("/admin/profile", headers=auth).get_json()["active"] is False
+    assert client.get("/admin/profile", headers=auth).mimetype == "text/plain"
+    assert client.post("/admin/profile", json={"duration_s": "inf"}, headers=auth).status_code == 400
@@ -1,7 +1,10 @@
 import json
 import os
 
-from app.utils import tokenize
+import pytest
+
+from app import config
+from app.utils import parse_deadline_ms, tokenize
 from app.retrieval import HybridRetriever
 
 
@@ -14,6 +17,17 @@ def test_tokenize_basic():
     assert "quick" in toks and "brown" in toks and "fox" in toks
 
 
+def test_parse_deadline_ms(monkeypatch):
+    monkeypatch.setattr(config, "REQUEST_DEADLINE_MS", 1500.0)
+    assert parse_deadline_ms(None) == 1500.0
+    assert parse_deadline_ms("250") == 250.0
+    # An explicit 0 turns the default deadline off
+    assert parse_deadline_ms(0) is None
+    for bad in (-1, float("inf"), "nan", "soon", [1], False):
+        with pytest.raises(ValueError):
+            parse_deadline_ms(bad)
+
+
 def test_rrf_fusion_and_bm25(monkeypatch, tmp_path):
     # Prepare a tiny fake corpus.json
     corpus = [
@@ -31,7 +45,7 @@ def test_rrf_fusion_and_bm25(monkeypatch, tmp_path):
     monkeypatch.setattr(config, "COLLECTION_NAME", "test_kb", raising=False)
 
     # Monkeypatch HybridRetriever to skip Chroma vector search and just return empty vector hits
-    def fake_vector_search(self, query: str, k: int):
+    def fake_vector_search(self, query: str, k: int, timeout=None):
         return []
 
     monkeypatch.setenv("OPENAI_API_KEY", "test")
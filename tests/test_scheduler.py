@@ -0,0 +1,128 @@
+import threading
+import time
+
+import pytest
+
+from app.scheduler import LLMScheduler, QueueFullError
+
+
+def _drain(s: LLMScheduler):
+    s.buckets._state["req"] = 0.0
+
+
+def test_interactive_served_before_background():
+    s = LLMScheduler(rpm=120, max_queue=8)
+    _drain(s)
+    order = []
+
+    def call(prio):
+        s.acquire(prio, 1)
+        order.append(prio)
+
+    bg = threading.Thread(target=call, args=("background",))
+    bg.start()
+    time.sleep(0.05)
+    fg = threading.Thread(target=call, args=("interactive",))
+    fg.start()
+    bg.join(5)
+    fg.join(5)
+    assert order == ["interactive", "background"]
+    assert s.stats()["granted"] == 2
+
+
+def test_queue_bound_and_timeout_raise_queue_full():
+    s = LLMScheduler(rpm=60, max_queue=0)
+    with pytest.raises(QueueFullError) as exc:
+        s.admit()
+    assert exc.value.retry_after_header == "1"
+
+    s = LLMScheduler(rpm=6, max_queue=4)
+    _drain(s)
+    with pytest.raises(QueueFullError):
+        s.acquire("interactive", 1, timeout=0.05)
+    assert s.stats()["timed_out"] == 1
+
+
+def test_tpm_bucket_blocks_large_calls():
+    s = LLMScheduler(tpm=600, max_queue=4)
+    s.acquire("interactive", 600)
+    with pytest.raises(QueueFullError):
+        s.acquire("interactive", 100, timeout=0.05)
+    s.settle(600, 0)  # actual usage lower than estimated refunds the bucket
+    s.acquire("interactive", 100, timeout=0.05)
+
+
+def test_file_buckets_shared(tmp_path):
+    path = str(tmp_path / "sched.json")
+    a = LLMScheduler(rpm=2, state_path=path)
+    b = LLMScheduler(rpm=2, state_path=path)
+    a.acquire("interactive", 1)
+    b.acquire("interactive", 1)
+    with pytest.raises(QueueFullError):
+        a.acquire("interactive", 1, timeout=0.05)
+
+
+def test_ask_returns_429_when_queue_full(monkeypatch):
+    import app.server as server
+
+    monkeypatch.setattr(server, "get_scheduler", lambda: LLMScheduler(max_queue=0))
+    resp = server.app.test_client().post("/ask", json={"question": "sleep?"})
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "1"
+
+
+def test_rate_limiter_adapter_goes_through_scheduler(monkeypatch):
+    import asyncio
+    import app.llm as llm
+
+    s = LLMScheduler(rpm=2, max_queue=4)
+    monkeypatch.setattr(llm, "get_scheduler", lambda: s)
+    limiter = llm.SchedulerRateLimiter("background", tokens=10, timeout=0.05)
+    assert limiter.acquire()
+    assert asyncio.run(limiter.aacquire())
+    assert limiter.acquire(blocking=False) is False
+    with pytest.raises(QueueFullError):
+        limiter.acquire()
+    assert s.stats()["wait"]["background"]["count"] == 2
+
+
+def test_query_embedding_timeout_bounds_queue_wait(monkeypatch):
+    import app.llm
+    from app.llm import ScheduledEmbeddings
+
+    class Inner:
+        def embed_query(self, text, **kwargs):
+            return [0.0]
+
+    sched = LLMScheduler(rpm=1, queue_timeout=30.0)
+    sched.acquire("interactive", 1)
+    monkeypatch.setattr(app.llm, "get_scheduler", lambda: sched)
+    emb = ScheduledEmbeddings(Inner())
+    start = time.monotonic()
+    with pytest.raises(QueueFullError):
+        emb.embed_query("sleep", timeout=0.2)
+    assert time.monotonic() - start < 1.0
+
+
+def test_embeddings_can_wait_out_a_busy_scheduler(monkeypatch):
+    import app.llm
+    from app.llm import ScheduledEmbeddings
+
+    class Inner:
+        chunk_size = 2
+
+        def embed_documents(self, texts):
+            return [[0.0] for _ in texts]
+
+    # Queue wait far shorter than the refill interval: every batch first times out
+    sched = LLMScheduler(rpm=600, queue_timeout=0.01)
+    _drain(sched)
+    monkeypatch.setattr(app.llm, "get_scheduler", lambda: sched)
+    sched.retry_after = lambda: 0.05
+
+    with pytest.raises(QueueFullError):
+        ScheduledEmbeddings(Inner(), priority="background").embed_documents(["a", "b", "c"])
+    _drain(sched)
+    out = ScheduledEmbeddings(Inner(), priority="background", wait_for_capacity=True).embed_documents(["a", "b", "c"])
+    assert len(out) == 3
+    assert sched.stats()["timed_out"] >= 2